@@ -0,0 +1,88 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from collections import OrderedDict
+import json
+import time
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class AnalysisReport:
+    def __init__(self, silent=0):
+        '''
+        Wall and cpu time of each stage of an Analysis and counters of the work done: events scanned, histograms
+        and toys made for each sample, and the nll values computed (the values already kept are not counted), Newton
+        iterations of mu-hat and Minuit fits, of the batched fits and of the ProfileL objects. Recording
+        costs two clock reads per stage and one addition per counter, so it is always on.
+        :param silent: if 1, print_report does not print anything (see AnalyzeInfo.silent_analysis)
+        '''
+        self.silent = silent
+        # dictionary with the stage name and its 'wall' and 'cpu' seconds. A stage started again adds to its times
+        self.stages = OrderedDict()
+        self.current = None
+        self.counters = OrderedDict()
+        # dictionary with the sample name and a dictionary with its counters
+        self.samples = OrderedDict()
+        self.profiles = {'number': 0, 'nll_evaluations': 0, 'minuit_calls': 0, 'fit_iterations': 0, 'max_nll_evaluations': 0, 'max_minuit_calls': 0}
+
+    def start(self, stage):
+        # ends the current stage and starts 'stage'
+        self.stop()
+        self.current = (stage, time.time(), time.clock())
+
+    def stop(self):
+        if self.current is None:
+            return
+        stage, wall, cpu = self.current
+        times = self.stages.setdefault(stage, {'wall': 0., 'cpu': 0.})
+        times['wall'] += time.time() - wall
+        times['cpu'] += time.clock() - cpu
+        self.current = None
+
+    def add(self, counter, number=1):
+        self.counters[counter] = self.counters.get(counter, 0) + number
+
+    def set_sample(self, sample, **counters):
+        self.samples.setdefault(sample, OrderedDict()).update(counters)
+
+    def add_profile(self, nll_evaluations, minuit_calls, fit_iterations=0):
+        # counters of one ProfileL, also added to the totals of the Analysis
+        self.profiles['number'] += 1
+        self.profiles['nll_evaluations'] += nll_evaluations
+        self.profiles['minuit_calls'] += minuit_calls
+        self.profiles['fit_iterations'] += fit_iterations
+        self.add('nll_evaluations', nll_evaluations)
+        self.add('fit_iterations', fit_iterations)
+        self.profiles['max_nll_evaluations'] = max(self.profiles['max_nll_evaluations'], nll_evaluations)
+        self.profiles['max_minuit_calls'] = max(self.profiles['max_minuit_calls'], minuit_calls)
+
+    def as_dict(self):
+        profiles = dict(self.profiles)
+        number = float(max(profiles['number'], 1))
+        profiles['mean_nll_evaluations'] = profiles['nll_evaluations'] / number
+        profiles['mean_minuit_calls'] = profiles['minuit_calls'] / number
+        return {'stages': self.stages, 'counters': self.counters, 'samples': self.samples, 'profiles': profiles}
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+
+    def print_report(self):
+        if self.silent:
+            return
+        print_banner('Analysis report', '-')
+        for stage, times in self.stages.iteritems():
+            print '{stage:<24} wall {wall:8.3f} s   cpu {cpu:8.3f} s'.format(stage=stage, wall=times['wall'], cpu=times['cpu'])
+        for counter, number in self.counters.iteritems():
+            print '{counter:<24} {number}'.format(counter=counter, number=number)
+        for sample, counters in self.samples.iteritems():
+            print '{sample:<24} {counters}'.format(sample=sample, counters=', '.join('{k}: {v}'.format(k=k, v=v) for k, v in counters.iteritems()))
+        if self.profiles['number']:
+            values = self.as_dict()['profiles']
+            print 'ProfileL: {n}, nll evaluations per ProfileL {nll:.1f} (max {max_nll}), Minuit fits per ProfileL {minuit:.2f}'.format(
+                n=values['number'], nll=values['mean_nll_evaluations'], max_nll=values['max_nll_evaluations'], minuit=values['mean_minuit_calls'])
@@ -3,11 +3,8 @@
 #   author: Pin-Jung Diego Alejandro
 # ---------------------------------------------------
 
-from ROOT import TFile, TMath
-from ROOT import TTree
-from ROOT import TH1F
-from glob import glob
-from copy import deepcopy
+from math import pi
+import json
 
 __author__ = 'Pin-Jung & Diego Alejandro'
 
@@ -53,14 +50,14 @@ class AnalyzeInfo:
 
         # minimum values
         self.branch_min = {}
-        self.branch_min['acop'] = TMath.Pi()/20
+        self.branch_min['acop'] = pi/20
         self.branch_min['acthm'] = float(1/20)
         self.branch_min['btag1'] = float(1/20)
         self.branch_min['btag2'] = float(1/20)
         self.branch_min['ele_ene'] = 0
         self.branch_min['ele_num'] = 0
-        self.branch_min['ele_phi'] = 2*TMath.Pi()/20 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
-        self.branch_min['ele_the'] = TMath.Pi()/20
+        self.branch_min['ele_phi'] = 2*pi/20 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_min['ele_the'] = pi/20
         self.branch_min['encm'] = 0
         self.branch_min['enj1'] = 20
         self.branch_min['enj2'] = 20
@@ -72,16 +69,16 @@ class AnalyzeInfo:
         self.branch_min['mmis'] = 45
         self.branch_min['muon_ene'] = 0
         self.branch_min['muon_num'] = 0
-        self.branch_min['muon_phi'] = 2*TMath.Pi()/20 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
-        self.branch_min['muon_the'] = TMath.Pi()/20
+        self.branch_min['muon_phi'] = 2*pi/20 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_min['muon_the'] = pi/20
         self.branch_min['mvis'] = 40
         self.branch_min['mvissc'] = 50
         self.branch_min['phj1'] = 0 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
         self.branch_min['phj2'] = 0 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
         self.branch_min['pho_ene'] = 0
         self.branch_min['pho_num'] = 0
-        self.branch_min['pho_phi'] = 2*TMath.Pi()/20 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
-        self.branch_min['pho_the'] = TMath.Pi()/20
+        self.branch_min['pho_phi'] = 2*pi/20 # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_min['pho_the'] = pi/20
         self.branch_min['thj1'] = 0
         self.branch_min['thj2'] = 0
         self.branch_min['ucsdbt0'] = 0
@@ -91,14 +88,14 @@ class AnalyzeInfo:
 
         # maximum values
         self.branch_max = {}
-        self.branch_max['acop'] = TMath.Pi()
+        self.branch_max['acop'] = pi
         self.branch_max['acthm'] = 1
         self.branch_max['btag1'] = 1
         self.branch_max['btag2'] = 1
         self.branch_max['ele_ene'] = 70
         self.branch_max['ele_num'] = 4
-        self.branch_max['ele_phi'] = 2*TMath.Pi() # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
-        self.branch_max['ele_the'] = TMath.Pi()
+        self.branch_max['ele_phi'] = 2*pi # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_max['ele_the'] = pi
         self.branch_max['encm'] = 200
         self.branch_max['enj1'] = 100
         self.branch_max['enj2'] = 100
@@ -110,16 +107,16 @@ class AnalyzeInfo:
         self.branch_max['mmis'] = 135
         self.branch_max['muon_ene'] = 20
         self.branch_max['muon_num'] = 3
-        self.branch_max['muon_phi'] = 2*TMath.Pi() # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
-        self.branch_max['muon_the'] = TMath.Pi()
+        self.branch_max['muon_phi'] = 2*pi # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_max['muon_the'] = pi
         self.branch_max['mvis'] = 150
         self.branch_max['mvissc'] = 100
-        self.branch_max['phj1'] = 2*TMath.Pi() # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
-        self.branch_max['phj2'] = 2*TMath.Pi() # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_max['phj1'] = 2*pi # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_max['phj2'] = 2*pi # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
         self.branch_max['pho_ene'] = 70
         self.branch_max['pho_num'] = 6
-        self.branch_max['pho_phi'] = 2*TMath.Pi() # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
-        self.branch_max['pho_the'] = TMath.Pi()
+        self.branch_max['pho_phi'] = 2*pi # check if it starts from 0 to 2 Pi or if it is from -Pi to Pi
+        self.branch_max['pho_the'] = pi
         self.branch_max['thj1'] = 3
         self.branch_max['thj2'] = 3
         self.branch_max['ucsdbt0'] = 20
@@ -424,11 +421,35 @@ class AnalyzeInfo:
         self.toggle_cuts['xmj2'] = 1
         # self.toggle_cuts['invmassH'] = 28
 
+        # cross sections (pb) and number of generated events of each sample. The MC are scaled to the data luminosity
+        self.cross_sections = {'eeqq': 15600, 'qq': 102, 'wen': 2.9, 'ww': 16.5, 'zee': 3.35, 'zz': 0.975, '85': 0.094, '90': 0.0667, '95': 0.0333}
+        self.num_events = {'eeqq': 5940000, 'qq': 200000, 'wen': 81786, 'ww': 294500, 'zee': 29500, 'zz': 196000, '85': 3972, '90': 3973, '95': 3971}
+        self.data_luminosity = 176.773
+
         self.monte_carlo_to_analyse = '85'
         self.test_statistics_branch = 'mvissc'
         self.number_toys = 10
+        # seed of the random streams of the toys (see RandomStreams)
+        self.toy_seed = 123654
         self.bins_q_histos = 100
+        # 'newton' fits mu-hat of all the toys at once (see PoissonLikelihood.fit_mu); 'minuit' uses TMinuit per toy
+        self.mu_fit_method = 'newton'
+        # number of processes fitting the toys (see ParallelToyFit). 1 fits them in this process, -1 uses all the cores
+        self.number_workers = 1
+        # number of toys fitted by each job of the workers
+        self.toys_chunk_size = 1000
         self.silent_analysis = 0
+        # read the branches from the columnar cache (see EventCache) instead of the root files
+        self.use_event_cache = 1
+        # number of events evaluated at once when filling the histograms from the cache (see HistogramFiller)
+        self.fill_chunk_size = 500000
+        # branches whose histograms are filled when the Analysis is built, together with the test statistics branch.
+        # The histograms of the other branches are filled the first time they are used
+        self.preload_branches = []
+        # keep the filled histograms of each sample on disk, keyed by the configuration (see TemplateCache)
+        self.use_template_cache = 1
+        # bytes of the TemplateCache folder above which the least recently used histograms are removed
+        self.template_cache_size = 200 * 1024 * 1024
 
     def change_cut_low(self, branch, value):
         self.branch_85_lowcut[branch] = value
@@ -457,4 +478,51 @@ class AnalyzeInfo:
         self.silent_analysis = value
 
     def change_number_toys(self, number):
-        self.number_toys = number
\ No newline at end of file
+        self.number_toys = number
+
+    def change_use_event_cache(self, value):
+        self.use_event_cache = value
+
+    def change_fill_chunk_size(self, size):
+        self.fill_chunk_size = size
+
+    def change_toy_seed(self, seed):
+        self.toy_seed = seed
+
+    def change_mu_fit_method(self, method):
+        self.mu_fit_method = method
+
+    def change_number_workers(self, number):
+        self.number_workers = number
+
+    def change_toys_chunk_size(self, size):
+        self.toys_chunk_size = size
+
+    def change_preload_branches(self, branches):
+        self.preload_branches = list(branches)
+
+    def change_use_template_cache(self, value):
+        self.use_template_cache = value
+
+    def change_template_cache_size(self, size):
+        self.template_cache_size = size
+
+    def histogram_branches(self):
+        # branches filled in bulk: the test statistics branch and the preload_branches
+        return [self.test_statistics_branch] + [branch for branch in self.preload_branches if branch != self.test_statistics_branch]
+
+    def load_cuts(self, filename='optimized_cuts.json', masses=None):
+        '''
+        Loads a cut table written by CutOptimizer: the low and high cuts of each Higgs MC in it, and toggles the cuts
+        of its branches.
+        :param masses: Higgs MC whose cuts are loaded. By default all the MC in the table
+        '''
+        with open(filename) as f:
+            table = json.load(f)
+        for mc, entry in table.iteritems():
+            if masses is not None and mc not in masses:
+                continue
+            getattr(self, 'branch_{mc}_lowcut'.format(mc=mc)).update(entry['lowcut'])
+            getattr(self, 'branch_{mc}_highcut'.format(mc=mc)).update(entry['highcut'])
+            for branch in entry['branches']:
+                self.change_toggle_cuts(branch, 1)
@@ -0,0 +1,146 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from Likelihood import *
+from math import erf, exp, log, pi, sqrt
+from numpy import asarray, inf
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+# coefficients of the rational approximations of the inverse of the normal distribution (P. J. Acklam)
+quantile_a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+quantile_b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01, -1.328068155288572e+01]
+quantile_c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+quantile_d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+
+
+def normal_cdf(x):
+    return 0.5 * (1 + erf(x / sqrt(2.)))
+
+
+def normal_quantile(p):
+    '''
+    :param p: probability, 0 < p < 1
+    :return: x with normal_cdf(x) = p. Rational approximation refined with one Halley step (relative error ~1e-15)
+    '''
+    if p <= 0:
+        return -inf
+    if p >= 1:
+        return inf
+    if p < 0.02425:
+        q = sqrt(-2 * log(p))
+        x = (((((quantile_c[0] * q + quantile_c[1]) * q + quantile_c[2]) * q + quantile_c[3]) * q + quantile_c[4]) * q + quantile_c[5]) / ((((quantile_d[0] * q + quantile_d[1]) * q + quantile_d[2]) * q + quantile_d[3]) * q + 1)
+    elif p > 1 - 0.02425:
+        q = sqrt(-2 * log(1 - p))
+        x = -(((((quantile_c[0] * q + quantile_c[1]) * q + quantile_c[2]) * q + quantile_c[3]) * q + quantile_c[4]) * q + quantile_c[5]) / ((((quantile_d[0] * q + quantile_d[1]) * q + quantile_d[2]) * q + quantile_d[3]) * q + 1)
+    else:
+        q = p - 0.5
+        r = q * q
+        x = (((((quantile_a[0] * r + quantile_a[1]) * r + quantile_a[2]) * r + quantile_a[3]) * r + quantile_a[4]) * r + quantile_a[5]) * q / (((((quantile_b[0] * r + quantile_b[1]) * r + quantile_b[2]) * r + quantile_b[3]) * r + quantile_b[4]) * r + 1)
+    error = normal_cdf(x) - p
+    u = error * sqrt(2 * pi) * exp(0.5 * x * x)
+    return x - u / (1 + x * u / 2)
+
+
+class AsymptoticLimit:
+    def __init__(self, likelihood, data_counts=None):
+        '''
+        Asymptotic (large sample) distributions of q0 and q_mu (Cowan, Cranmer, Gross, Vitells, arXiv:1007.1727),
+        evaluated on the Asimov datasets of the templates instead of toys. q_mu is the one of ProfileL, which uses
+        L(0) when mu-hat < 0 (the q~_mu of the paper).
+        :param likelihood: PoissonLikelihood with the background and signal templates
+        :param data_counts: numpy array with the observed counts, needed for the observed values
+        '''
+        self.likelihood = likelihood
+        self.data_counts = asarray(data_counts, dtype='float64') if data_counts is not None else None
+        # Asimov datasets: the expected counts without signal and with the nominal signal (mu = 1)
+        self.asimov_bkg = self.likelihood.expected([0.])
+        self.asimov_sgnbkg = self.likelihood.expected([1.])
+
+    def nll(self, counts, mu):
+        return float(self.likelihood.nll_at(counts, [float(mu)])[0])
+
+    def sigma(self, mu):
+        # standard deviation of mu-hat from the Asimov background dataset: q_mu,A = mu^2 / sigma^2
+        q_mu_asimov = self.nll(self.asimov_bkg, mu) - self.nll(self.asimov_bkg, 0)
+        return mu / sqrt(q_mu_asimov) if q_mu_asimov > 0 else inf
+
+    def q0_asimov(self):
+        # median q0 expected with signal (mu-hat = 1 for the Asimov signal+background dataset)
+        return max(self.nll(self.asimov_sgnbkg, 0) - self.nll(self.asimov_sgnbkg, 1), 0.)
+
+    def expected_significance(self, bands=(-2, -1, 0, 1, 2)):
+        # dictionary with N and the expected Z0 when the signal is present: the median is sqrt(q0,A), the bands +- N
+        median = sqrt(self.q0_asimov())
+        return {n: max(median + n, 0.) for n in bands}
+
+    def expected_q_mu(self, mu, bands=(-2, -1, 0, 1, 2)):
+        # dictionary with N and q_mu expected without signal when mu-hat is N sigma away from 0
+        ratio = mu / self.sigma(mu)
+        return {n: (ratio - n) ** 2 if n < ratio else 0. for n in bands}
+
+    def expected_cls(self, mu, bands=(-2, -1, 0, 1, 2)):
+        # dictionary with N and the CLs of mu expected without signal, CLs = (1 - Phi(mu/sigma - N)) / Phi(N)
+        ratio = mu / self.sigma(mu)
+        return {n: (1 - normal_cdf(ratio - n)) / normal_cdf(n) for n in bands}
+
+    def expected_limits(self, alpha=0.05, bands=(-2, -1, 0, 1, 2), iterations=20, tolerance=1e-6):
+        '''
+        :return: dictionary with N and the expected upper limit mu = sigma * (Phi^-1(1 - alpha Phi(N)) + N). sigma
+        depends on mu, so the limit is iterated until it does not change
+        '''
+        limits = {}
+        for n in bands:
+            mu = 1.
+            for iteration in xrange(iterations):
+                new_mu = self.sigma(mu) * (normal_quantile(1 - alpha * normal_cdf(n)) + n)
+                if abs(new_mu - mu) < tolerance:
+                    break
+                mu = new_mu
+            limits[n] = new_mu
+        return limits
+
+    def observed_q(self, mu):
+        # (q0, q_mu) of the data with the rules of ProfileL
+        q0, q_mu = self.likelihood.q_values(self.data_counts, mu)[:2]
+        return float(q0[0]), float(q_mu[0])
+
+    def observed_p0(self):
+        # p-value of the background only hypothesis, p0 = 1 - Phi(sqrt(q0))
+        return 1 - normal_cdf(sqrt(max(self.observed_q(1.)[0], 0.)))
+
+    def observed_cls(self, mu):
+        '''
+        :return: dictionary with 'p_sb', 'p_b', 'cls' and 'q_obs' of mu for the data, with the same definitions as
+        QAccumulator.cls: p_sb = P(q_mu >= q_obs | mu), p_b = P(q_mu <= q_obs | 0), CLs = p_sb / (1 - p_b)
+        '''
+        q = max(self.observed_q(mu)[1], 0.)
+        ratio = mu / self.sigma(mu)
+        if q <= ratio ** 2:
+            p_sb = 1 - normal_cdf(sqrt(q))
+            p_b = 1 - normal_cdf(ratio - sqrt(q))
+        else:
+            p_sb = 1 - normal_cdf((q + ratio ** 2) / (2 * ratio))
+            p_b = 1 - normal_cdf((ratio ** 2 - q) / (2 * ratio))
+        cls = p_sb / (1 - p_b) if p_b < 1 else 0.
+        return {'p_sb': p_sb, 'p_b': p_b, 'cls': cls, 'q_obs': q}
+
+    def observed_limit(self, alpha=0.05, mu_ini=1., tolerance=1e-4, max_steps=60):
+        # mu where the observed CLs crosses alpha, bracketed by doubling mu and then found by bisection
+        low, high = 0., float(mu_ini)
+        while self.observed_cls(high)['cls'] >= alpha:
+            if max_steps == 0:
+                return None
+            low, high = high, 2 * high
+            max_steps -= 1
+        while high - low > tolerance:
+            mu = 0.5 * (low + high)
+            if self.observed_cls(mu)['cls'] >= alpha:
+                low = mu
+            else:
+                high = mu
+        return 0.5 * (low + high)
@@ -0,0 +1,210 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from ROOT import TFile, TTree
+from HiggsProjekt import *
+from CutsScan import *
+from optparse import OptionParser
+from array import array
+from copy import deepcopy
+import numpy
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+# mass of the Higgs of each signal MC, where its mvis and mvissc peak
+signal_masses = {'85': 85., '90': 90., '95': 95.}
+
+
+class SyntheticSamples:
+    def __init__(self, analyzeInfo, data_folder='l3higgs189/', scale=0.01, seed=2016):
+        '''
+        Writes higgs_<sample>.root files with an 'h20' tree with the branches of analyzeInfo, so the whole analysis
+        can be run and timed without the files of the course.
+        Each MC sample has scale * num_events events. The data has scale * cross_section * luminosity events of each
+        background, so the data/MC scaling factors are the ones of the real samples. The backgrounds are smooth in
+        every branch (with some events outside the ranges of the histograms) and the signals peak in mvis and mvissc at
+        the mass of their Higgs.
+        :param scale: fraction of the events of the real samples
+        :param seed: seed of the random numbers, the same seed writes the same files
+        '''
+        self.analyze_info = analyzeInfo
+        self.data_folder = data_folder
+        self.scale = scale
+        self.seed = seed
+        self.backgrounds = sorted(name for name in self.analyze_info.num_events if not name.isdigit())
+        self.signals = sorted(name for name in self.analyze_info.num_events if name.isdigit())
+
+    def number_events(self, name):
+        if name == 'data':
+            return sum(self.data_events(background) for background in self.backgrounds)
+        return max(int(round(self.scale * self.analyze_info.num_events[name])), 1)
+
+    def data_events(self, background):
+        return int(round(self.scale * self.analyze_info.cross_sections[background] * self.analyze_info.data_luminosity))
+
+    def sample_values(self, name, number, random):
+        # dictionary with the branch name and the values of 'number' events of the sample 'name'
+        index = (self.backgrounds + self.signals).index(name)
+        values = {}
+        for position, branch in enumerate(self.analyze_info.branch_names):
+            low = self.analyze_info.branch_min[branch]
+            high = self.analyze_info.branch_max[branch]
+            width = high - low
+            # the shape of each background and branch is a different beta distribution
+            column = low + width * random.beta(1 + (index + position) % 3, 1 + (2 * index + position) % 4, number)
+            if name in signal_masses and branch in ('mvis', 'mvissc'):
+                column = random.normal(signal_masses[name], 3., number)
+            outside = random.rand(number) < 0.05
+            column[outside] = random.uniform(low - 0.2 * width, high + 0.2 * width, outside.sum())
+            values[branch] = column.astype('float32')
+        return values
+
+    def write_tree(self, name, values, number):
+        rootfile = TFile(os.path.join(self.data_folder, 'higgs_{name}.root'.format(name=name)), 'RECREATE')
+        tree = TTree('h20', 'h20')
+        buffers = {branch: array('f', [0.]) for branch in self.analyze_info.branch_names}
+        for branch in self.analyze_info.branch_names:
+            tree.Branch(branch, buffers[branch], branch + '/F')
+        for event in xrange(number):
+            for branch in self.analyze_info.branch_names:
+                buffers[branch][0] = values[branch][event]
+            tree.Fill()
+        tree.Write()
+        rootfile.Close()
+
+    def write(self):
+        if not os.path.exists(self.data_folder):
+            os.makedirs(self.data_folder)
+        random = numpy.random.RandomState(self.seed)
+        for name in self.backgrounds + self.signals:
+            self.write_tree(name, self.sample_values(name, self.number_events(name), random), self.number_events(name))
+        # the data are drawn from the backgrounds only
+        parts = [self.sample_values(background, self.data_events(background), random) for background in self.backgrounds]
+        data = {branch: numpy.concatenate([part[branch] for part in parts]) for branch in self.analyze_info.branch_names}
+        self.write_tree('data', data, self.number_events('data'))
+
+    def events(self):
+        return {name: self.number_events(name) for name in self.backgrounds + self.signals + ['data']}
+
+
+class Benchmark:
+    def __init__(self, work_folder='benchmark/', scale=0.01, number_toys=1000, numdiv=5, seed=2016, reuse_samples=0):
+        '''
+        Times each stage of the analysis on synthetic samples (see SyntheticSamples). Everything is run inside
+        work_folder, which gets its own l3higgs189/, l3higgs189_cache/ and output files.
+        :param scale: fraction of the events of the real samples
+        :param number_toys: number of toys of the Analysis
+        :param numdiv: divisions of each cut of the CutsScan grid
+        :param reuse_samples: if 1, the synthetic files already in work_folder are used
+        '''
+        self.work_folder = work_folder
+        self.scale = scale
+        self.number_toys = number_toys
+        self.numdiv = numdiv
+        self.seed = seed
+        self.reuse_samples = reuse_samples
+        # dictionary with the stage name and its wall and cpu seconds
+        self.timings = OrderedDict()
+        self.events = {}
+
+    def time(self, stage, function, *args):
+        wall = time.time()
+        cpu = time.clock()
+        result = function(*args)
+        self.timings[stage] = {'wall': time.time() - wall, 'cpu': time.clock() - cpu}
+        print '{stage}: {wall:.3f} s'.format(stage=stage, wall=self.timings[stage]['wall'])
+        return result
+
+    def analyze_info(self, mu_fit_method='newton'):
+        info = AnalyzeInfo()
+        info.change_silent_analysis(1)
+        info.change_number_toys(self.number_toys)
+        info.change_mu_fit_method(mu_fit_method)
+        # every run fills the histograms, a cached run would not time anything
+        info.change_use_template_cache(0)
+        return info
+
+    def fill_histograms(self, info, trees):
+        # all the branches of every sample with the cuts of the MC analysed, filled by DataTree as in the Analysis. The
+        # toys are not generated here (see generate_toys)
+        fill_info = deepcopy(info)
+        fill_info.change_number_toys(0)
+        for name, tree in trees.iteritems():
+            cross_section, num_events = (-1, -1) if name == 'data' else (info.cross_sections[name], info.num_events[name])
+            data_tree = DataTree(fill_info, tree, name, cross_section, num_events, RandomStreams(info.toy_seed))
+            data_tree.branches_histograms.fill(info.branch_names)
+
+    def generate_toys(self, info, analysis):
+        for name, data_tree in analysis.background_data_trees.items() + analysis.mc_higgs_data_trees.items():
+            BatchToyExperimentGen(info, data_tree.branches_histogram_no_norm[info.test_statistics_branch], info.test_statistics_branch,
+                                  analysis.random_streams, info.number_toys, name, name, info.monte_carlo_to_analyse).ensemble()
+
+    def run(self):
+        home = os.getcwd()
+        if not os.path.exists(self.work_folder):
+            os.makedirs(self.work_folder)
+        os.chdir(self.work_folder)
+        try:
+            info = self.analyze_info()
+            samples = SyntheticSamples(info, 'l3higgs189/', self.scale, self.seed)
+            self.events = samples.events()
+            if not (self.reuse_samples and os.path.isdir('l3higgs189/')):
+                self.time('write_samples', samples.write)
+            for folder in ('l3higgs189_cache/', 'l3higgs189_templates/'):
+                if os.path.isdir(folder):
+                    shutil.rmtree(folder)
+            self.time('convert_trees', EventCache(info).load_trees)
+            # the trees already loaded are kept by EventCache, they are forgotten to time the loading
+            loaded_trees.clear()
+            trees = self.time('load_trees', EventCache(info).load_trees)
+            self.time('fill_histograms', self.fill_histograms, info, trees)
+            analysis = self.time('analysis', Analysis, info)
+            self.time('toy_generation', self.generate_toys, info, analysis)
+            self.time('profile_l_newton', analysis.calculate_profile_L_objects)
+            analysis_minuit = Analysis(self.analyze_info('minuit'))
+            self.time('profile_l_minuit', analysis_minuit.calculate_profile_L_objects)
+            # the q of the toys of profile_l_newton are in the QAccumulator, these stages do not fit them again
+            self.time('create_q_histograms', analysis.fill_q_histograms, 1, -1)
+            self.time('search_pvalues', analysis.calculate_pvalues, 1)
+            # CutsScan makes its own AnalyzeInfo, the template cache is turned off there as in analyze_info
+            self.time('cuts_scan', CutsScan, info.test_statistics_branch, 'mmis', -1, 1000, 1000, -1, self.numdiv, 0, ('85',), 'benchmark', 0)
+            self.time('cuts_scan_prefix_sums', CutsScan, info.test_statistics_branch, 'mmis', -1, 1000, 1000, -1, self.numdiv, 1, ('85',), 'benchmark', 0)
+        finally:
+            os.chdir(home)
+
+    def commit(self):
+        try:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=open(os.devnull, 'w')).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def write(self, filename='benchmark.json'):
+        results = {'commit': self.commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+                   'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'scale': self.scale, 'number_toys': self.number_toys,
+                   'numdiv': self.numdiv, 'seed': self.seed, 'events': self.events, 'timings': self.timings}
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-o', '--output', dest='output', default='benchmark.json', type='string', help='JSON file with the timings')
+    parser.add_option('-w', '--work', dest='work', default='benchmark/', type='string', help='folder of the synthetic samples and the outputs')
+    parser.add_option('-s', '--scale', dest='scale', default=0.01, type='float', help='fraction of the events of the real samples')
+    parser.add_option('-n', '--numtoys', dest='numtoys', default=1000, type='int', help='number of toys')
+    parser.add_option('-d', '--numdiv', dest='numdiv', default=5, type='int', help='divisions of each cut of the CutsScan grid')
+    parser.add_option('-r', '--reuse', dest='reuse', default=0, type='int', help='1 uses the synthetic samples already written')
+    (options, args) = parser.parse_args()
+    benchmark = Benchmark(options.work, options.scale, options.numtoys, options.numdiv, reuse_samples=options.reuse)
+    benchmark.run()
+    benchmark.write(options.output)
@@ -0,0 +1,200 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from Likelihood import *
+from QAccumulator import *
+from RandomStreams import *
+from numpy import arange, asarray, sqrt, zeros
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class CLsCore:
+    def __init__(self, backgrounds, signal, data_counts, nbins, seed=123654, mc='85', batch_size=-1, max_toys=1000, z=2., likelihood=None, max_mu=50.):
+        '''
+        Statistics of the limit (toys, mu-hat fits, q values, p-values and CLs) from numpy arrays only: this module and
+        the ones it imports do not import ROOT, so a process that only fits toys starts in milliseconds.
+        The background toys (and their mu-hat) are generated once for all mu. The signal+background toys of each mu
+        are generated with the same random numbers for all mu (the same RandomStreams positions), so CLs(mu) is smooth
+        in mu and the search of its crossing is stable.
+        The toys are generated in batches. With batch_size < max_toys, each mu starts with one batch and more batches
+        are added only while alpha is inside the interval of CLs given by the Wilson intervals of p_sb and p_b (see
+        is_decided).
+        :param backgrounds: list of (sample name, unscaled expected counts of the bins 1 ... nbins+1, scaling factor)
+        :param signal: (MC name, unscaled expected counts, scaling factor) of the signal
+        :param data_counts: observed counts of the bins 1 ... nbins
+        :param nbins: number of bins used by the likelihood
+        :param seed: seed of the RandomStreams of the toys
+        :param mc: Higgs MC of the streams of the toys. e.g. '85'
+        :param batch_size: number of toys of each batch. By default all the toys in one batch
+        :param max_toys: maximum number of toys of each mu
+        :param z: number of standard deviations of the Wilson intervals of p_sb and p_b
+        :param likelihood: PoissonLikelihood of the templates. By default it is made from the expected counts
+        :param max_mu: largest mu evaluated by the searches. A search whose crossing is above it returns None, the toys
+        of a very large mu would not fit in memory
+        '''
+        self.backgrounds = [(name, asarray(expected, dtype='float64'), scale) for name, expected, scale in backgrounds]
+        self.signal = (signal[0], asarray(signal[1], dtype='float64'), signal[2])
+        self.nbins = nbins
+        self.mc = mc
+        self.random_streams = RandomStreams(seed)
+        self.max_toys = max_toys
+        self.batch_size = min(batch_size, self.max_toys) if batch_size > 0 else self.max_toys
+        self.z = z
+        self.max_mu = float(max_mu)
+        if likelihood is None:
+            background = sum(scale * expected[:self.nbins] for name, expected, scale in self.backgrounds)
+            likelihood = PoissonLikelihood(background, self.signal[2] * self.signal[1][:self.nbins])
+        self.likelihood = likelihood
+        self.data_counts = asarray(data_counts, dtype='float64')
+        self.fit_data = self.likelihood.fit_mu(self.data_counts)
+        # list with (toys, fit of mu-hat) of each batch of background toys, shared by all mu
+        self.background_batches = []
+        # dictionary with (mu, alpha) and the result of QAccumulator.cls for it. The toys used for a mu depend on the
+        # alpha of the search (see is_decided), so a result is only reused for the same alpha
+        self.curve = {}
+        self.alpha = None
+
+    def sample_toys(self, sample, mu, first, last):
+        # same streams and positions as the toys of DataTree, so the toys 0 ... number_toys-1 are those of the Analysis of mc
+        name, expected, scale = sample
+        counts = self.random_streams.poisson(mu * expected, name, self.mc, arange(first, last))
+        return scale * counts[:, :self.nbins]
+
+    def background_batch(self, batch):
+        while len(self.background_batches) <= batch:
+            first = len(self.background_batches) * self.batch_size
+            last = first + self.batch_size
+            toys = zeros((self.batch_size, self.nbins))
+            for sample in self.backgrounds:
+                toys += self.sample_toys(sample, 1., first, last)
+            self.background_batches.append((toys, self.likelihood.fit_mu(toys)))
+        return self.background_batches[batch]
+
+    def add_batch(self, accumulator, mu, batch):
+        # adds the q values of the batch of toys 'batch' of this mu to the accumulator
+        toys_bkg, fit_bkg = self.background_batch(batch)
+        first = batch * self.batch_size
+        toys_sgnbkg = toys_bkg + self.sample_toys(self.signal, mu, first, first + self.batch_size)
+        q0_bkg, qe_bkg = self.likelihood.q_values(toys_bkg, mu, fit=fit_bkg)[:2]
+        q0_sgnbkg, qe_sgnbkg = self.likelihood.q_values(toys_sgnbkg, mu)[:2]
+        accumulator.add(q0_bkg, q0_sgnbkg, qe_bkg, qe_sgnbkg)
+
+    def wilson_interval(self, fraction, number_toys):
+        # Wilson score interval of a binomial fraction, which does not shrink to a point at 0 or 1
+        z2 = self.z ** 2 / number_toys
+        center = (fraction + z2 / 2) / (1 + z2)
+        half = self.z * sqrt(fraction * (1 - fraction) / number_toys + z2 / (4 * number_toys)) / (1 + z2)
+        return max(center - half, 0.), min(center + half, 1.)
+
+    def is_decided(self, result, number_toys):
+        '''
+        CLs < alpha or CLs > alpha is decided when alpha is outside [p_sb low / (1 - p_b low), p_sb high / (1 - p_b
+        high)], the bounds of CLs from the Wilson intervals of p_sb and p_b. A p_sb of 0 or a p_b of 1 only says that
+        the tail was not reached by these toys, so it is never decided before the budget is used.
+        '''
+        if self.alpha is None or result['p_sb'] == 0 or result['p_b'] == 1:
+            return False
+        p_sb_low, p_sb_high = self.wilson_interval(result['p_sb'], number_toys)
+        p_b_low, p_b_high = self.wilson_interval(result['p_b'], number_toys)
+        cls_low = p_sb_low / (1 - p_b_low)
+        if p_b_high >= 1:
+            return cls_low > self.alpha
+        return cls_low > self.alpha or p_sb_high / (1 - p_b_high) < self.alpha
+
+    def cls(self, mu):
+        '''
+        :param mu: signal strength tested
+        :return: dictionary of QAccumulator.cls for the observed q_mu of the data, plus 'q_obs', 'median_b' (median
+        of the q_mu of the background toys) and 'toys' (number of toys used)
+        '''
+        mu = float(mu)
+        key = (mu, self.alpha)
+        if key not in self.curve:
+            # only the result is kept, the toys of another mu are generated again from the same streams
+            accumulator = QAccumulator()
+            q_obs = float(self.likelihood.q_values(self.data_counts, mu, fit=self.fit_data)[1][0])
+            batch = 0
+            while True:
+                self.add_batch(accumulator, mu, batch)
+                batch += 1
+                result = {name: float(value) for name, value in accumulator.cls(q_obs).iteritems()}
+                if self.is_decided(result, len(accumulator)) or len(accumulator) + self.batch_size > self.max_toys:
+                    break
+            result['q_obs'] = q_obs
+            result['median_b'] = float(accumulator['qeh0'].quantile(0.5))
+            result['toys'] = len(accumulator)
+            self.curve[key] = result
+        return self.curve[key]
+
+    def find_crossing(self, function, mu_ini=1., step=0.2, tolerance=0.01, max_steps=50):
+        '''
+        Finds the mu where function(mu) changes from >= 0 to < 0. The bracket is found stepping up from mu_ini (the
+        step is doubled each time, up to max_mu), then it is shrunk with secant steps (Illinois method), which fall back
+        to bisection when the secant does not shrink the bracket enough.
+        :return: the mu of the crossing, or None if no bracket was found below max_mu
+        '''
+        if mu_ini > self.max_mu:
+            return None
+        low, high = float(mu_ini), float(mu_ini)
+        f_low = f_high = function(low)
+        while f_high >= 0:
+            if max_steps == 0 or high >= self.max_mu:
+                return None
+            low, f_low = high, f_high
+            high = min(high + step, self.max_mu)
+            f_high = function(high)
+            step *= 2
+            max_steps -= 1
+        if f_low < 0:
+            # mu_ini was already above the crossing: step down
+            while f_low < 0:
+                if max_steps == 0 or low <= 0:
+                    return None
+                high, f_high = low, f_low
+                low = max(low - step, 0.)
+                f_low = function(low)
+                max_steps -= 1
+        side = 0
+        while high - low > tolerance:
+            mu = high - f_high * (high - low) / (f_high - f_low) if f_high != f_low else 0.5 * (low + high)
+            if not low + 0.1 * (high - low) < mu < high - 0.1 * (high - low):
+                mu = 0.5 * (low + high)
+            f_mu = function(mu)
+            if f_mu >= 0:
+                low, f_low = mu, f_mu
+                # Illinois: halves the value kept at the other end if this end moved twice in a row
+                f_high = f_high / 2 if side == -1 else f_high
+                side = -1
+            else:
+                high, f_high = mu, f_mu
+                f_low = f_low / 2 if side == 1 else f_low
+                side = 1
+        return 0.5 * (low + high)
+
+    def limit(self, alpha=0.05, mu_ini=1., step=0.2, tolerance=0.01):
+        '''
+        Upper limit on mu: the mu where CLs crosses alpha.
+        :return: (limit, CLs(mu) curve) where the curve is the list of (mu, CLs, error of CLs) of all the mu evaluated
+        '''
+        # the toys of each mu are added in batches only until CLs is clearly above or below this alpha
+        self.alpha = alpha
+        limit = self.find_crossing(lambda mu: self.cls(mu)['cls'] - alpha, mu_ini, step, tolerance)
+        return limit, self.cls_curve()
+
+    def median_limit(self, mu_ini=1., step=0.2, tolerance=0.01):
+        # mu where the median of the q_mu of the background toys reaches the observed q_mu, as MCHiggsScan.search_median.
+        # There is no alpha to decide on, so all the toys are used
+        self.alpha = None
+        return self.find_crossing(lambda mu: self.cls(mu)['q_obs'] - self.cls(mu)['median_b'], mu_ini, step, tolerance)
+
+    def cls_curve(self):
+        # the mu evaluated for the alpha of the last search
+        return [(mu, result['cls'], result['cls_error']) for (mu, alpha), result in sorted(self.curve.iteritems()) if alpha == self.alpha]
+
+    def toys_used(self):
+        return sum(result['toys'] for result in self.curve.values())
@@ -0,0 +1,48 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from HiggsProjekt import *
+from CLsCore import *
+from numpy import asarray
+from copy import deepcopy
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class CLsLimit(CLsCore):
+    def __init__(self, analyzeInfo, mc='85', analysis=None, batch_size=-1, max_toys=-1, z=2., max_mu=50.):
+        '''
+        CLs as a function of mu, evaluated on demand from one Analysis. The samples and the templates are loaded once,
+        then everything is done by CLsCore on the numpy arrays of the templates.
+        :param analyzeInfo: AnalyzeInfo object with the number of toys and the cuts
+        :param mc: Higgs MC used as signal. e.g. '85'
+        :param analysis: Analysis already built for mc. By default it is built here
+        :param batch_size: number of toys of each batch. By default all the toys in one batch
+        :param max_toys: maximum number of toys of each mu. By default analyzeInfo.number_toys
+        :param z: number of standard deviations of the intervals of p_sb and p_b (see CLsCore.is_decided)
+        :param max_mu: largest mu evaluated by the searches (see CLsCore)
+        '''
+        self.analyze_info = analyzeInfo
+        self.analyze_info.change_montecarlo_to_analyse(mc)
+        if analysis is None:
+            # the toys are generated here batch by batch, so the Analysis does not generate any
+            templates_info = deepcopy(self.analyze_info)
+            templates_info.change_number_toys(0)
+            analysis = Analysis(templates_info)
+        self.analysis = analysis
+        self.branch = self.analyze_info.test_statistics_branch
+        nbins = self.analyze_info.branch_numbins[self.branch]
+        data_counts = [self.analysis.data_histogram.GetBinContent(bin) for bin in xrange(1, nbins + 1)]
+        # (name, unscaled expected counts of all the bins, scale factor) of the samples, in the order of the Analysis
+        backgrounds = [self.sample_toys_info(self.analysis.background_data_trees[name], name, nbins) for name in self.analysis.background_names]
+        signal = self.sample_toys_info(self.analysis.mc_higgs_data_trees[mc], mc, nbins)
+        CLsCore.__init__(self, backgrounds, signal, data_counts, nbins, self.analyze_info.toy_seed, mc, batch_size,
+                         max_toys if max_toys > 0 else self.analyze_info.number_toys, z, self.analysis.templates_likelihood(), max_mu)
+
+    def sample_toys_info(self, data_tree, name, nbins):
+        histo = data_tree.branches_histogram_no_norm[self.branch]
+        return name, asarray([histo.GetBinContent(bin) for bin in xrange(1, nbins + 2)], dtype='float64'), data_tree.scaling_factor
@@ -0,0 +1,245 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from EventCache import *
+from HistogramFiller import *
+from Asymptotic import normal_cdf
+from optparse import OptionParser
+from numpy import arange, asarray, concatenate, cumsum, errstate, inf, linspace, log, maximum, ones, sqrt, unique, where, zeros
+from numpy import bincount, searchsorted
+from numpy.random import RandomState
+import json
+import os
+import time
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class CutOptimizer:
+    def __init__(self, analyzeInfo, mc='85', branches=None, objective='significance', grid=40, seed=2016, min_background=0.,
+                 data_folder='l3higgs189/', cache_folder='l3higgs189_cache/'):
+        '''
+        Optimizes the low and high cuts of several branches together for one Higgs MC. The samples are read once from
+        the EventCache and each cut value is turned into a position in a grid of candidate values, so every
+        configuration of cuts is evaluated with integer comparisons over the events (see passes and coordinate_step).
+        Only the events inside the histogram range of the test statistics branch are counted, as Analysis.significance
+        does with the Integral of the histograms.
+        :param analyzeInfo: AnalyzeInfo object. Its cuts are the starting point, the cuts toggled and not optimized stay
+        fixed
+        :param mc: Higgs MC used as signal. e.g. '85'
+        :param branches: branches whose cuts are optimized. By default the toggled cuts of analyzeInfo
+        :param objective: 'significance' maximizes s / sqrt(b) as Analysis.significance. 'cls' maximizes the expected
+        exclusion significance of mu = 1 of a counting experiment, sqrt(2 (s - b ln(1 + s / b))), which minimizes its
+        expected CLs
+        :param grid: number of candidate values of each cut between branch_min and branch_max
+        :param seed: seed of the random search
+        :param min_background: selections with fewer expected background events are not accepted, so the optimizer
+        does not end in a tail with almost no background
+        '''
+        self.analyze_info = analyzeInfo
+        self.mc = mc
+        self.objective = objective
+        self.min_background = min_background
+        self.random = RandomState(seed)
+        lowcuts = getattr(self.analyze_info, 'branch_{mc}_lowcut'.format(mc=mc))
+        highcuts = getattr(self.analyze_info, 'branch_{mc}_highcut'.format(mc=mc))
+        toggled = [branch for branch in self.analyze_info.branch_names if self.analyze_info.toggle_cuts[branch] == 1]
+        self.branches = list(branches) if branches is not None else toggled
+        # candidate values of the cuts of each branch, including the current cuts
+        self.grids = {branch: unique(concatenate((linspace(self.analyze_info.branch_min[branch], self.analyze_info.branch_max[branch], grid),
+                                                  [lowcuts[branch], highcuts[branch]]))) for branch in self.branches}
+        trees = EventCache(self.analyze_info, data_folder, cache_folder).load_trees()
+        fixed = {branch: (lowcuts[branch], highcuts[branch]) for branch in toggled if branch not in self.branches}
+        nbins, hmin, hmax = HistogramFiller(self.analyze_info).branch_binning(self.analyze_info.test_statistics_branch)
+        weights = []
+        signal = []
+        columns = {branch: [] for branch in self.branches}
+        for name, tree in trees.iteritems():
+            if name == 'data' or (name.isdigit() and name != mc):
+                continue
+            teststat = asarray(tree.columns[self.analyze_info.test_statistics_branch], dtype='float64')
+            mask = (teststat >= hmin) & (teststat < hmax)
+            if fixed:
+                mask &= tree.selection.mask(fixed)
+            scaling_factor = self.analyze_info.data_luminosity * self.analyze_info.cross_sections[name] / float(self.analyze_info.num_events[name])
+            weights.append(ones(mask.sum()) * scaling_factor)
+            signal.append(ones(mask.sum(), dtype=bool) if name == mc else zeros(mask.sum(), dtype=bool))
+            for branch in self.branches:
+                columns[branch].append(asarray(tree.columns[branch], dtype='float64')[mask])
+        self.weights = concatenate(weights)
+        self.signal_weights = where(concatenate(signal), self.weights, 0.)
+        self.background_weights = self.weights - self.signal_weights
+        # an event passes the cut (low, high) of a branch, given as positions in the grid, if
+        # position_low > low (value >= grid[low]) and position_high <= high (value <= grid[high])
+        self.position_low = {}
+        self.position_high = {}
+        for branch in self.branches:
+            values = concatenate(columns[branch])
+            self.position_low[branch] = searchsorted(self.grids[branch], values, 'right').astype('uint16')
+            self.position_high[branch] = searchsorted(self.grids[branch], values, 'left').astype('uint16')
+        # current cuts as positions in the grids
+        self.cuts = {branch: (int(searchsorted(self.grids[branch], lowcuts[branch])), int(searchsorted(self.grids[branch], highcuts[branch])))
+                     for branch in self.branches}
+        self.evaluated = 0
+
+    def objective_values(self, s, b):
+        with errstate(divide='ignore', invalid='ignore'):
+            if self.objective == 'cls':
+                values = sqrt(maximum(2 * (s - b * log(1 + s / b)), 0.))
+            else:
+                values = s / sqrt(b)
+            # no background is not taken as the best selection, as in Analysis.significance
+            return where((b > 0) & (b >= self.min_background), values, 0.)
+
+    def passes(self, cuts, skip=None):
+        mask = ones(len(self.weights), dtype=bool)
+        for branch in self.branches:
+            if branch != skip:
+                low, high = cuts[branch]
+                mask &= (self.position_low[branch] > low) & (self.position_high[branch] <= high)
+        return mask
+
+    def value(self, cuts):
+        mask = self.passes(cuts)
+        self.evaluated += 1
+        return float(self.objective_values(self.signal_weights[mask].sum(), self.background_weights[mask].sum()))
+
+    def coordinate_step(self, cuts, branch):
+        '''
+        Evaluates at once all the (low, high) of one branch with the other cuts fixed: the events that pass the other
+        cuts are counted in a 2-D histogram of their positions, and its cumulative sums give s and b of every (low, high)
+        :return: (best (low, high), its value)
+        '''
+        mask = self.passes(cuts, branch)
+        size = len(self.grids[branch]) + 1
+        cells = self.position_low[branch][mask].astype('int64') * size + self.position_high[branch][mask]
+        totals = []
+        for weights in (self.signal_weights, self.background_weights):
+            histogram = bincount(cells, weights=weights[mask], minlength=size * size).reshape(size, size)
+            # sums over position_low > low and position_high <= high
+            above = cumsum(histogram[::-1], axis=0)[::-1]
+            totals.append(cumsum(above, axis=1)[1:, :-1])
+        values = self.objective_values(totals[0], totals[1])
+        low, high = arange(size - 1)[:, None], arange(size - 1)[None, :]
+        values = where(low < high, values, -inf)
+        self.evaluated += (size - 1) * (size - 2) / 2
+        best = values.argmax()
+        return (int(best / (size - 1)), int(best % (size - 1))), float(values.flat[best])
+
+    def descend(self, cuts, max_sweeps=20):
+        # coordinate descent: each branch in turn takes its best (low, high), until no branch improves
+        cuts = dict(cuts)
+        value = self.value(cuts)
+        for sweep in xrange(max_sweeps):
+            improved = False
+            for branch in self.branches:
+                best, best_value = self.coordinate_step(cuts, branch)
+                if best_value > value + 1e-12:
+                    cuts[branch] = best
+                    value = best_value
+                    improved = True
+            if not improved:
+                break
+        return cuts, value
+
+    def random_configurations(self, number):
+        # list of random cuts: for each branch a random low and a random high above it
+        configurations = []
+        for i in xrange(number):
+            cuts = {}
+            for branch in self.branches:
+                size = len(self.grids[branch])
+                low = self.random.randint(0, size - 1)
+                cuts[branch] = (low, self.random.randint(low + 1, size))
+            configurations.append(cuts)
+        return configurations
+
+    def random_search(self, number, max_cells=20000000):
+        '''
+        :return: list of (value, cuts) of number random configurations, best first. They are evaluated in chunks of
+        configurations x events boolean masks
+        '''
+        configurations = self.random_configurations(number)
+        chunk = max(1, max_cells / max(len(self.weights), 1))
+        results = []
+        for first in xrange(0, number, chunk):
+            part = configurations[first:first + chunk]
+            mask = ones((len(part), len(self.weights)), dtype=bool)
+            for branch in self.branches:
+                lows = asarray([cuts[branch][0] for cuts in part])[:, None]
+                highs = asarray([cuts[branch][1] for cuts in part])[:, None]
+                mask &= (self.position_low[branch][None, :] > lows) & (self.position_high[branch][None, :] <= highs)
+            values = self.objective_values(mask.dot(self.signal_weights), mask.dot(self.background_weights))
+            results += zip(values.tolist(), part)
+            self.evaluated += len(part)
+        results.sort(key=lambda result: -result[0])
+        return results
+
+    def optimize(self, random_configurations=2000, starts=5):
+        '''
+        Coordinate descent from the current cuts, then from the best configurations of a random search.
+        :return: dictionary with 'cuts' (branch and (low, high) values), 'value', 'signal', 'background',
+        'expected_cls' (only for the objective 'cls'), 'evaluated' (configurations evaluated) and 'seconds'
+        '''
+        start = time.time()
+        self.evaluated = 0
+        best_cuts, best_value = self.descend(self.cuts)
+        if self.branches and random_configurations > 0:
+            for value, cuts in self.random_search(random_configurations)[:starts]:
+                cuts, value = self.descend(cuts)
+                if value > best_value:
+                    best_cuts, best_value = cuts, value
+        self.cuts = best_cuts
+        mask = self.passes(best_cuts)
+        result = {'mc': self.mc, 'objective': self.objective, 'value': best_value,
+                  'cuts': {branch: (float(self.grids[branch][low]), float(self.grids[branch][high])) for branch, (low, high) in best_cuts.iteritems()},
+                  'signal': float(self.signal_weights[mask].sum()), 'background': float(self.background_weights[mask].sum()),
+                  'evaluated': self.evaluated, 'seconds': time.time() - start}
+        if self.objective == 'cls':
+            # median CLs of mu = 1 without signal, (1 - Phi(sqrt(q_mu,A))) / Phi(0)
+            result['expected_cls'] = 2 * (1 - normal_cdf(best_value))
+        if not self.analyze_info.silent_analysis:
+            print 'Higgs {mc}: {objective} = {value:.4f} with s = {s:.3f}, b = {b:.3f} ({n} configurations in {t:.2f} s)'.format(
+                mc=self.mc, objective=self.objective, value=best_value, s=result['signal'], b=result['background'],
+                n=self.evaluated, t=result['seconds'])
+            for branch in self.branches:
+                print '   {branch}: {low} ... {high}'.format(branch=branch, low=result['cuts'][branch][0], high=result['cuts'][branch][1])
+        return result
+
+    def write(self, result, filename='optimized_cuts.json'):
+        '''
+        Adds the cuts of result to the cut table 'filename' (one entry per Higgs MC), which AnalyzeInfo.load_cuts reads
+        '''
+        table = {}
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                table = json.load(f)
+        table[self.mc] = {'branches': self.branches, 'lowcut': {branch: cuts[0] for branch, cuts in result['cuts'].iteritems()},
+                          'highcut': {branch: cuts[1] for branch, cuts in result['cuts'].iteritems()},
+                          'objective': self.objective, 'value': result['value']}
+        temp_name = filename + '.tmp'
+        with open(temp_name, 'w') as f:
+            json.dump(table, f, indent=1, sort_keys=True)
+        os.rename(temp_name, filename)
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-m', '--masses', dest='masses', default='85,90,95', type='string', help='Higgs MC separated by commas')
+    parser.add_option('-b', '--branches', dest='branches', default='', type='string', help='branches to optimize separated by commas. By default the toggled cuts')
+    parser.add_option('-f', '--objective', dest='objective', default='significance', type='string', help="'significance' or 'cls'")
+    parser.add_option('-g', '--grid', dest='grid', default=40, type='int', help='candidate values of each cut')
+    parser.add_option('-r', '--random', dest='random', default=2000, type='int', help='configurations of the random search')
+    parser.add_option('-n', '--minbkg', dest='minbkg', default=0., type='float', help='minimum expected background of a selection')
+    parser.add_option('-o', '--output', dest='output', default='optimized_cuts.json', type='string', help='cut table')
+    (options, args) = parser.parse_args()
+    info = AnalyzeInfo()
+    branches = options.branches.split(',') if options.branches else None
+    for mc in options.masses.split(','):
+        # the columns of the samples are loaded by the first optimizer and kept by EventCache for the others
+        optimizer = CutOptimizer(info, mc, branches, options.objective, options.grid, min_background=options.minbkg)
+        optimizer.write(optimizer.optimize(options.random), options.output)
@@ -8,6 +8,7 @@ from glob import glob
 from copy import deepcopy
 from DataTree import *
 from AnalyzeInfo import *
+from numpy import ones, asarray
 
 __author__ = 'Pin-Jung & Diego Alejandro'
 
@@ -43,3 +44,24 @@ class Cuts:
             else:
                 word = word + '&&' + branchname + '>=' + str(self.analyze_info.branch_95_lowcut[branchname]) + '&&' + branchname + '<=' + str(self.analyze_info.branch_95_highcut[branchname])
         return word
+
+    def getCutBounds(self, mcname):
+        '''
+        :param mcname: name of the MC whose cuts are used. e.g. '85'
+        :return: dictionary with the toggled branches and the (low, high) values of their cuts
+        '''
+        lowcuts = {'85': self.analyze_info.branch_85_lowcut, '90': self.analyze_info.branch_90_lowcut, '95': self.analyze_info.branch_95_lowcut}[mcname]
+        highcuts = {'85': self.analyze_info.branch_85_highcut, '90': self.analyze_info.branch_90_highcut, '95': self.analyze_info.branch_95_highcut}[mcname]
+        return {branch: (lowcuts[branch], highcuts[branch]) for branch in self.analyze_info.branch_names if self.analyze_info.toggle_cuts[branch] == 1}
+
+    def getCutMask(self, mcname, columns):
+        '''
+        :param mcname: name of the MC whose cuts are used. e.g. '85'
+        :param columns: dictionary with the branch name and a numpy array with its values for each event
+        :return: boolean numpy array which is True for the events that pass the same cuts as getCutWord(mcname)
+        '''
+        mask = ones(len(columns[self.analyze_info.branch_names[0]]), dtype=bool)
+        for branch, (low, high) in self.getCutBounds(mcname).iteritems():
+            values = asarray(columns[branch], dtype='float64')
+            mask &= (values >= low) & (values <= high)
+        return mask
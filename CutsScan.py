@@ -12,6 +12,9 @@ from ToyExperimentGen import *
 from ProfileL import *
 from numpy import *
 from HiggsProjekt import *
+from WindowScan import *
+from SharedSamples import *
+from collections import OrderedDict
 import os
 
 
@@ -20,7 +23,7 @@ __author__ = 'Pin-Jung & Diego Alejandro'
 from Utils import *
 
 class CutsScan:
-    def __init__(self, teststat, branch, cut_low_ini=-1, cut_low_end=1000, cut_high_ini=1000, cut_high_end=-1):
+    def __init__(self, teststat, branch, cut_low_ini=-1, cut_low_end=1000, cut_high_ini=1000, cut_high_end=-1, numdiv=10, use_prefix_sums=0, masses=('85', '90', '95'), output_subdir='', use_template_cache=0):
         self.analyze_info = AnalyzeInfo()
         self.teststat = teststat
         self.branch_cut = branch
@@ -28,30 +31,81 @@ class CutsScan:
         self.analyze_info.switch_off_all_cuts()
         self.analyze_info.change_silent_analysis(1)
         self.analyze_info.change_number_toys(0)
+        # off by default: each point of the grid is a selection used once, storing its histograms would only fill (and
+        # evict) the TemplateCache, and the workers of ParallelCutsScan would all write in it at the same time
+        self.analyze_info.change_use_template_cache(use_template_cache)
         self.cut_low_ini = cut_low_ini
         self.cut_low_end = cut_low_end
         self.cut_high_ini = cut_high_ini
         self.cut_high_end = cut_high_end
+        self.numdiv = numdiv
+        # with use_prefix_sums the samples are loaded once and every window is computed from cumulative sums (see
+        # WindowScan) instead of creating an Analysis for each point of the grid
+        self.use_prefix_sums = use_prefix_sums
+        # the histograms are saved in <mc>/<teststat>/<output_subdir>
+        self.output_subdir = output_subdir
         self.stuff = []
-        print_banner('STARTING WITH HIGGS 85', '%')
-        self.start_analysis('85')
-        self.make_analysis()
-        self.save_histograms('85')
-        print_banner('STARTING WITH HIGGS 90', '%')
-        self.start_analysis('90')
-        self.make_analysis()
-        self.save_histograms('90')
-        print_banner('STARTING WITH HIGGS 95', '%')
-        self.start_analysis('95')
-        self.make_analysis()
-        self.save_histograms('95')
+        self.masses = masses
+        if self.use_prefix_sums:
+            for mh in self.masses:
+                print_banner('STARTING WITH HIGGS '+mh, '%')
+                self.start_analysis(mh)
+                self.make_analysis()
+                self.save_histograms(mh)
+        else:
+            # the Analysis of every point and every mass use the same samples. The cuts are set equal for all the
+            # masses, so the DataTree of each point is built for the first mass and reused by the others (see
+            # SharedSamples)
+            self.shared = SharedSamples(self.analyze_info)
+            self.scan_masses()
+
+    def scan_masses(self):
+        # the points of the grid are the outer loop: the DataTree of a point are used by all the masses and released
+        # before the next point, so the DataTree of only one point are kept
+        scans = OrderedDict()
+        for mh in self.masses:
+            print_banner('STARTING WITH HIGGS '+mh, '%')
+            self.start_analysis(mh)
+            scans[mh] = self.scan_state()
+        self.shared.release()
+        print_banner('Filling histograms with data...', '-')
+        for cutx, cuty in self.grid_points():
+            for mh in self.masses:
+                self.set_scan_state(scans[mh])
+                self.make_cuts(cutx, cuty)
+            self.shared.release()
+        for mh in self.masses:
+            self.set_scan_state(scans[mh])
+            self.save_histograms(mh)
+
+    def scan_state(self):
+        # everything of the scan that depends on the mass
+        return {'mc': self.analyze_info.monte_carlo_to_analyse, 's_ini': self.s_ini, 'h_stam_name': self.h_stam_name,
+                'h_eff': self.h_eff, 'h_purity': self.h_purity, 'h_signif': self.h_signif}
+
+    def set_scan_state(self, state):
+        self.analyze_info.change_montecarlo_to_analyse(state['mc'])
+        self.s_ini = state['s_ini']
+        self.h_stam_name = state['h_stam_name']
+        self.h_eff = state['h_eff']
+        self.h_purity = state['h_purity']
+        self.h_signif = state['h_signif']
+
+    def grid_points(self):
+        return [(cutx, cuty) for cutx in linspace(self.low_cut_ini, self.low_cut_end, int(self.numdiv+1))
+                for cuty in linspace(self.high_cut_ini, self.high_cut_end, int(self.numdiv+1)) if cuty > cutx]
 
     def start_analysis(self, mh='85'):
         self.analyze_info.change_montecarlo_to_analyse(mh)
         self.analyze_info.switch_off_all_cuts()
-        print_banner('Creating Analysis...', '=')
-        self.analysis0 = Analysis(self.analyze_info)
-        self.s_ini = Double(self.analysis0.mc_histograms_dict[self.analyze_info.monte_carlo_to_analyse][self.teststat].Integral())
+        if self.use_prefix_sums:
+            print_banner('Sorting the events...', '=')
+            self.window_scan = WindowScan(self.analyze_info, self.teststat, self.branch_cut, mh)
+            self.s_ini = self.window_scan.signal_total
+        else:
+            print_banner('Creating Analysis...', '=')
+            self.analysis0 = Analysis(self.analyze_info, self.shared)
+            self.s_ini = Double(self.analysis0.mc_histograms_dict[self.analyze_info.monte_carlo_to_analyse][self.teststat].Integral())
         if self.cut_low_ini == -1:
             self.low_cut_ini = self.analyze_info.branch_min[self.branch_cut]
             self.high_cut_ini = self.analyze_info.branch_max[self.branch_cut]
@@ -62,7 +116,6 @@ class CutsScan:
             self.high_cut_ini = self.cut_high_ini
             self.low_cut_end = self.cut_low_end
             self.high_cut_end = self.cut_high_end
-        self.numdiv = 10
         self.low_cut_step = float(self.low_cut_end - self.low_cut_ini)/float(int(self.numdiv))
         self.high_cut_step = float(self.high_cut_end - self.high_cut_ini)/float(self.numdiv)
         self.h_stam_name = mh + '_'+self.branch_cut
@@ -84,32 +137,40 @@ class CutsScan:
 
     def make_analysis(self):
         print_banner('Filling histograms with data...', '-')
-        for cutx in linspace(self.low_cut_ini, self.low_cut_end, int(self.numdiv+1)):
-            for cuty in linspace(self.high_cut_ini, self.high_cut_end, int(self.numdiv+1)):
-                if cuty > cutx:
-                    self.make_cuts(cutx, cuty)
+        self.make_window_scan()
 
     def make_cuts(self, x, y):
         self.analyze_info.change_toggle_cuts(self.branch_cut, 1)
         self.analyze_info.change_cut_low(self.branch_cut, x)
         self.analyze_info.change_cut_high(self.branch_cut, y)
-        self.analysis = Analysis(self.analyze_info)
+        self.analysis = Analysis(self.analyze_info, self.shared)
         self.s = Double(self.analysis.mc_histograms_dict[self.analyze_info.monte_carlo_to_analyse][self.teststat].Integral())
+        self.fill_point(x, y, float(self.s/self.s_ini), float(self.analysis.purity(self.teststat)), float(self.analysis.significance(self.teststat)))
+
+    def make_window_scan(self):
+        grid_x, grid_y = meshgrid(linspace(self.low_cut_ini, self.low_cut_end, int(self.numdiv+1)), linspace(self.high_cut_ini, self.high_cut_end, int(self.numdiv+1)))
+        points = grid_y > grid_x
+        cutsx = grid_x[points]
+        cutsy = grid_y[points]
+        effs, purities, signifs = self.window_scan.scan(cutsx, cutsy)
+        for i in xrange(len(cutsx)):
+            self.fill_point(cutsx[i], cutsy[i], effs[i], purities[i], signifs[i])
+
+    def fill_point(self, x, y, eff, purity, signif):
         deltax = float(linspace(self.low_cut_ini, self.low_cut_end, int(self.numdiv+1))[1] - linspace(self.low_cut_ini, self.low_cut_end, int(self.numdiv+1))[0])
         deltay = float(linspace(self.high_cut_end, self.high_cut_ini, int(self.numdiv + 1))[1] -linspace(self.high_cut_end, self.high_cut_ini, int(self.numdiv + 1))[0])
         binx = int(float(x - self.low_cut_ini)/deltax + 1)
         biny = int(float(y - self.high_cut_end)/deltay + 1)
-        self.h_eff.SetBinContent(binx, biny, float(self.s/self.s_ini))
-        self.h_purity.SetBinContent(binx, biny, float(self.analysis.purity(self.teststat)))
-        self.h_signif.SetBinContent(binx, biny, float(self.analysis.significance(self.teststat)))
+        self.h_eff.SetBinContent(binx, biny, float(eff))
+        self.h_purity.SetBinContent(binx, biny, float(purity))
+        self.h_signif.SetBinContent(binx, biny, float(signif))
 
     def save_histograms(self, mc='85'):
         print_banner('Saving histograms', '-')
-        if not os.path.exists(mc+'/'):
-            os.makedirs(mc+'/')
-        if not os.path.exists(mc+'/'+self.teststat+'/'):
-            os.makedirs(mc+'/'+self.teststat+'/')
-        f = TFile(mc+'/'+self.teststat+'/histos_{mc}_{bra}.root'.format(mc=mc, bra=self.branch_cut),'RECREATE')
+        outdir = self.output_dir(mc)
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        f = TFile(outdir+'histos_{mc}_{bra}.root'.format(mc=mc, bra=self.branch_cut),'RECREATE')
         gStyle.SetPalette(53)
         self.h_eff.SetContour(1024)
         self.h_eff.SetStats(kFALSE)
@@ -119,7 +180,7 @@ class CutsScan:
         c0.cd()
         self.h_eff.Draw('colz')
         self.h_eff.Write()
-        c0.SaveAs(mc+'/'+self.teststat+'/'+self.h_stam_name+'_h_eff.png')
+        c0.SaveAs(outdir+self.h_stam_name+'_h_eff.png')
         self.h_purity.SetContour(1024)
         self.h_purity.SetStats(kFALSE)
         self.h_purity.GetXaxis().SetTitle('low cut')
@@ -128,7 +189,7 @@ class CutsScan:
         c1.cd()
         self.h_purity.Draw('colz')
         self.h_purity.Write()
-        c1.SaveAs(mc + '/' + self.teststat + '/'+self.h_stam_name+'_h_purity.png')
+        c1.SaveAs(outdir+self.h_stam_name+'_h_purity.png')
         self.h_signif.SetContour(1024)
         self.h_signif.SetStats(kFALSE)
         self.h_signif.GetXaxis().SetTitle('low cut')
@@ -137,15 +198,20 @@ class CutsScan:
         c2.cd()
         self.h_signif.Draw('colz')
         self.h_signif.Write()
-        c2.SaveAs(mc + '/' + self.teststat + '/'+self.h_stam_name+'_h_signif.png')
+        c2.SaveAs(outdir+self.h_stam_name+'_h_signif.png')
         f.Close()
         # self.stuff.append(c0)
         # self.stuff.append(c1)
         # self.stuff.append(c2)
 
+    def output_dir(self, mc='85'):
+        return os.path.join(mc, self.teststat, self.output_subdir, '')
+
 if __name__ == '__main__':
     print_banner('STARTING HIGGS CUTS ANALYSIS', '#')
     mode = int(raw_input('Mode: 0 for Automatic; 1 for general specific; 2 for very specific: ? '))
+    use_prefix_sums = int(raw_input('Engine: 0 for an Analysis per point; 1 for prefix sums: ? ') or 0)
+    numdiv = int(raw_input('Number of divisions of the grid (default 10): ') or 10)
     if mode == 0:
         ana = AnalyzeInfo()
         for branch in ana.branch_names:
@@ -156,12 +222,12 @@ if __name__ == '__main__':
                 # del w
                 teststat = 'mvissc'
                 print_banner('Running: {test} with branch {bra}'.format(test=teststat, bra=branch), '=')
-                w = CutsScan(teststat, branch)
+                w = CutsScan(teststat, branch, numdiv=numdiv, use_prefix_sums=use_prefix_sums)
                 del w
     elif mode == 1:
         teststat = raw_input('Enter the name of the test statistics used: ')
         branch = raw_input('Enter the name of the branch to study its cuts: ')
-        w = CutsScan(teststat, branch)
+        w = CutsScan(teststat, branch, numdiv=numdiv, use_prefix_sums=use_prefix_sums)
     else:
         teststat = raw_input('Enter the name of the test statistics used: ')
         branch = raw_input('Enter the name of the branch to study its cuts: ')
@@ -169,4 +235,4 @@ if __name__ == '__main__':
         cut_low_end = float(raw_input('Enter the final low cut: '))
         cut_high_ini = float(raw_input('Enter the initial high cut: '))
         cut_high_end = float(raw_input('Enter the final high cut: '))
-        w = CutsScan(teststat, branch, cut_low_ini, cut_low_end, cut_high_ini, cut_high_end)
\ No newline at end of file
+        w = CutsScan(teststat, branch, cut_low_ini, cut_low_end, cut_high_ini, cut_high_end, numdiv, use_prefix_sums)
\ No newline at end of file
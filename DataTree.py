@@ -10,6 +10,9 @@ from AnalyzeInfo import *
 from array import array
 from Cuts import *
 from ToyExperimentGen import *
+from EventCache import CachedTree
+from HistogramFiller import *
+import numpy
 
 __author__ = 'Pin-Jung & Diego Alejandro'
 
@@ -17,7 +20,13 @@ from Utils import *
 
 
 class DataTree:
-    def __init__(self, analyzeInfo, tree, name, cross_sections, num_events, random):
+    def __init__(self, analyzeInfo, tree, name, cross_sections, num_events, random, filled=None, template_cache=None):
+        '''
+        :param filled: (counts, number of selected events) of HistogramFiller for the selection of analyzeInfo, if the
+        cached columns of the tree were already filled (see SharedSamples.prefill)
+        :param template_cache: TemplateCache object. The counts found in it are not filled again, and the counts filled
+        here are stored in it
+        '''
         self.tree_name = name
         self.tree = tree
         self.rand = random
@@ -25,24 +34,45 @@ class DataTree:
         if name == 'data':
             self.number_events = -1
             self.cross_section = -1
-            self.luminosity = 176.773
+            self.luminosity = analyzeInfo.data_luminosity
             self.scaling_factor = 1
         else:
             self.number_events = num_events
             self.cross_section = cross_sections
             self.luminosity = float(self.number_events) / self.cross_section
-            self.scaling_factor = 176.773 / self.luminosity
+            self.scaling_factor = analyzeInfo.data_luminosity / self.luminosity
         self.branches_info = analyzeInfo
         self.tree_entries = self.tree.GetEntries()
         self.cuts = Cuts(self.branches_info)
         self.cuts_words = self.cuts.cuts_words
-        self.branches_histogram_no_norm = {branch: self.GetBranchHistogram(branch, self.branches_info.branch_numbins[branch],
-                                                                    self.branches_info.branch_min[branch],
-                                                                    self.branches_info.branch_max[branch])
-                                    for branch in self.branches_info.branch_names}
-        self.branches_histograms = deepcopy(self.branches_histogram_no_norm)
-        for branch in self.branches_info.branch_names:
-            self.branches_histograms[branch].Scale(self.scaling_factor)
+        # the selection is read now: the histograms filled later must not see later changes of analyzeInfo
+        self.mc = self.branches_info.monte_carlo_to_analyse
+        self.cut_bounds = self.cuts.getCutBounds(self.mc)
+        self.cut_mask = None
+        self.filler = HistogramFiller(self.branches_info)
+        # dictionary with the branch name and its counts (bins 0 ... nbins+2), filled when its histogram is first needed
+        self.branches_counts = {}
+        self.selected_entries = 0
+        # counters of the work of this DataTree (see AnalysisReport)
+        self.events_scanned = 0
+        self.histograms_made = 0
+        self.template_cache = template_cache
+        self.template_key = self.template_cache.key(self.branches_info, name) if self.template_cache is not None else None
+        if self.template_cache is not None:
+            cached = self.template_cache.load(self.template_key)
+            if cached is not None:
+                self.branches_counts.update(cached[0])
+                self.selected_entries = cached[1]
+        if filled is not None:
+            self.branches_counts.update(filled[0])
+            self.selected_entries = filled[1]
+            if self.template_cache is not None:
+                self.template_cache.store(self.template_key, filled[0], filled[1])
+        # the histograms of a branch are made the first time they are used. The test statistics branch and the
+        # preload_branches of analyzeInfo are made now, in one scan of the events
+        self.branches_histogram_no_norm = LazyHistograms(self.branches_info.branch_names, self.make_branch_histogram, self.make_branch_histograms)
+        self.branches_histograms = LazyHistograms(self.branches_info.branch_names, self.scaled_branch_histogram, self.scaled_branch_histograms)
+        self.branches_histograms.fill(self.branches_info.histogram_branches())
         if name != 'data':
             if name == '85' or name == '90' or name == '95':
                 self.toys = self.generate_toy_experiments('signal_'+name, self.branches_info.test_statistics_branch,
@@ -51,17 +81,64 @@ class DataTree:
                 self.toys = self.generate_toy_experiments('background_'+name, self.branches_info.test_statistics_branch,
                                                           self.branches_info.number_toys)
 
+    def make_branch_histogram(self, branch):
+        return self.make_branch_histograms([branch])[branch]
+
+    def selection_mask(self):
+        # the mask of the cuts is kept by the Selection of the tree, so only the cuts that changed since the last
+        # Analysis are evaluated again
+        if self.cut_mask is None:
+            self.cut_mask = self.tree.selection.mask(self.cut_bounds)
+        return self.cut_mask
+
+    def make_branch_histograms(self, branches):
+        missing = [branch for branch in branches if branch not in self.branches_counts]
+        if missing and isinstance(self.tree, CachedTree):
+            counts, self.selected_entries = HistogramFiller(self.branches_info, missing).fill(self.tree.columns, self.tree_entries, mask=self.selection_mask())
+            self.events_scanned += self.tree_entries
+            self.branches_counts.update(counts)
+        histograms = {branch: self.GetBranchHistogram(branch, self.branches_info.branch_numbins[branch], self.branches_info.branch_min[branch],
+                                                      self.branches_info.branch_max[branch]) for branch in branches}
+        if missing and not isinstance(self.tree, CachedTree):
+            # the counts drawn from the tree, so they can be stored in the cache
+            for branch in missing:
+                self.branches_counts[branch] = numpy.array([histograms[branch].GetBinContent(bin) for bin in xrange(histograms[branch].GetNbinsX() + 2)])
+            self.selected_entries = int(histograms[missing[0]].GetEntries())
+        if missing and self.template_cache is not None:
+            self.template_cache.store(self.template_key, {branch: self.branches_counts[branch] for branch in missing}, self.selected_entries)
+        return histograms
+
+    def scaled_branch_histogram(self, branch):
+        # the unscaled histogram is kept for the toys, so the scaled one is a clone
+        histogram = self.branches_histogram_no_norm[branch].Clone(branch + '_' + self.tree_name + '_scaled')
+        histogram.SetDirectory(0)
+        histogram.Scale(self.scaling_factor)
+        self.histograms_made += 1
+        return histogram
+
+    def scaled_branch_histograms(self, branches):
+        self.branches_histogram_no_norm.fill(branches)
+        return {branch: self.scaled_branch_histogram(branch) for branch in branches}
+
     def GetBranchHistogram(self, branchname, nbins_histo, min_histo, max_histo):
         histogram_name = branchname + '_' + self.tree_name
-        cutword = self.cuts_words[self.branches_info.monte_carlo_to_analyse]
+        cutword = self.cuts_words[self.mc]
         histogram = TH1F(histogram_name, histogram_name, int(nbins_histo + 1), float(min_histo - float(max_histo - min_histo) / float(2 * nbins_histo)), float(max_histo + float(max_histo - min_histo) / float(2 * nbins_histo)))
         histogram.SetBinErrorOption(TH1F.kPoisson)
         histogram.SetStats(kFALSE)
-        self.tree.Draw('{branch}>>{histo}'.format(branch=branchname, histo=histogram_name), cutword, 'goff')
+        if branchname in self.branches_counts:
+            self.filler.fill_histogram(histogram, self.branches_counts[branchname], self.selected_entries)
+        else:
+            self.tree.Draw('{branch}>>{histo}'.format(branch=branchname, histo=histogram_name), cutword, 'goff')
+            self.events_scanned += self.tree_entries
         # histogram.Scale(self.scaling_factor)
-        return deepcopy(histogram)
+        # owned by this DataTree, not by the current directory (Draw needs it there only to find it by name)
+        histogram.SetDirectory(0)
+        self.histograms_made += 1
+        return histogram
 
     def generate_toy_experiments(self, type, branchname, num):
         name = type + '_' + branchname
         histo = self.branches_histogram_no_norm[branchname]
-        return {i: ToyExperimentGen(self.branches_info, histo, branchname, self.rand, i, name).toy for i in xrange(num)}
\ No newline at end of file
+        return BatchToyExperimentGen(self.branches_info, histo, branchname, self.rand, num, name, self.tree_name,
+                                     self.branches_info.monte_carlo_to_analyse).ensemble()
\ No newline at end of file
@@ -0,0 +1,158 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from ROOT import TFile
+from glob import glob
+import numpy
+import json
+import os
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+from Selection import *
+
+# numpy types used to store each kind of leaf of the h20 trees
+leaf_dtypes = {'Float_t': 'float32', 'Double_t': 'float64', 'Int_t': 'int32', 'UInt_t': 'uint32', 'Short_t': 'int16',
+               'UShort_t': 'uint16', 'Long64_t': 'int64', 'ULong64_t': 'uint64', 'Char_t': 'int8', 'UChar_t': 'uint8',
+               'Bool_t': 'bool'}
+
+# CachedTree objects already loaded in this session, so that the masks of their Selection are kept between Analysis
+loaded_trees = {}
+
+
+class CachedTree:
+    # Stands in for the 'h20' TTree of one sample. The columns are memory-mapped numpy arrays, one per branch.
+    def __init__(self, name, columns, entries):
+        self.name = name
+        self.columns = columns
+        self.entries = entries
+        self.selection = Selection(self.columns, self.entries)
+
+    def __deepcopy__(self, memo):
+        # the columns are read-only and shared, copying a DataTree must not load them in memory
+        return self
+
+    def GetName(self):
+        return self.name
+
+    def GetEntries(self):
+        return self.entries
+
+
+class EventCache:
+    def __init__(self, analyzeInfo, data_folder='l3higgs189/', cache_folder='l3higgs189_cache/'):
+        '''
+        :param analyzeInfo: AnalyzeInfo object. Its 'branch_names' are the branches that are stored in the cache
+        :param data_folder: folder with the higgs_*.root files
+        :param cache_folder: folder where the columns of each sample are stored as <sample>/<branch>.npy
+        '''
+        self.analyze_info = analyzeInfo
+        self.data_folder = data_folder
+        self.cache_folder = cache_folder
+        self.manifest_name = os.path.join(self.cache_folder, 'manifest.json')
+        self.manifest = self.load_manifest()
+
+    def sample_name(self, filename):
+        # same naming as Analysis.get_names_trees: 'l3higgs189/higgs_eeqq.root' -> 'eeqq'
+        return filename.split('/')[-1].strip('.root').split('higgs_')[-1]
+
+    def source_files(self):
+        return {self.sample_name(f): f for f in glob('{dir}*.root'.format(dir=self.data_folder))}
+
+    def fingerprint(self, filename):
+        stat = os.stat(filename)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def load_manifest(self):
+        if not os.path.isfile(self.manifest_name):
+            return {}
+        with open(self.manifest_name) as f:
+            return json.load(f)
+
+    def save_manifest(self, names):
+        # other processes may have converted other samples since this manifest was read: their entries are kept and
+        # only the entries of 'names' are written. The temporary file is per process, so two writers do not share it
+        manifest = self.load_manifest()
+        manifest.update({name: self.manifest[name] for name in names})
+        self.manifest = manifest
+        temp_name = '{name}.{pid}.tmp'.format(name=self.manifest_name, pid=os.getpid())
+        with open(temp_name, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.rename(temp_name, self.manifest_name)
+
+    def column_name(self, name, branch):
+        return os.path.join(self.cache_folder, name, branch + '.npy')
+
+    def is_valid(self, name, filename):
+        # the columns of a sample are valid if the source file did not change since the conversion
+        if name not in self.manifest:
+            return False
+        entry = self.manifest[name]
+        fingerprint = self.fingerprint(filename)
+        if entry['size'] != fingerprint['size'] or entry['mtime'] != fingerprint['mtime']:
+            return False
+        for branch in self.analyze_info.branch_names:
+            if branch not in entry['branches'] or not os.path.isfile(self.column_name(name, branch)):
+                return False
+        return True
+
+    def convert(self, name, filename):
+        if not self.analyze_info.silent_analysis:
+            print 'Converting', filename, 'into columns...'
+        try:
+            os.makedirs(os.path.join(self.cache_folder, name))
+        except OSError:
+            # already made, maybe by another process converting at the same time
+            if not os.path.isdir(os.path.join(self.cache_folder, name)):
+                raise
+        fingerprint = self.fingerprint(filename)
+        rootfile = TFile(filename)
+        tree = rootfile.Get('h20')
+        entries = int(tree.GetEntries())
+        branches = {}
+        for branch in self.analyze_info.branch_names:
+            column = self.read_branch(tree, branch, entries)
+            temp_name = '{name}.{pid}.tmp.npy'.format(name=self.column_name(name, branch), pid=os.getpid())
+            numpy.save(temp_name, column)
+            os.rename(temp_name, self.column_name(name, branch))
+            branches[branch] = str(column.dtype)
+        rootfile.Close()
+        self.manifest[name] = {'source': filename, 'size': fingerprint['size'], 'mtime': fingerprint['mtime'],
+                               'entries': entries, 'branches': branches}
+        self.save_manifest([name])
+
+    def read_branch(self, tree, branch, entries):
+        leaf = tree.GetLeaf(branch)
+        dtype = leaf_dtypes.get(leaf.GetTypeName(), 'float64')
+        if entries == 0:
+            return numpy.zeros(0, dtype=dtype)
+        # one Draw per branch without cuts. The values are kept by the tree in the V1 buffer (as doubles)
+        tree.SetEstimate(entries + 1)
+        tree.Draw(branch, '', 'goff')
+        if tree.GetSelectedRows() != entries:
+            raise ValueError('branch {b} does not have one value per event'.format(b=branch))
+        values = numpy.frombuffer(tree.GetV1(), dtype='float64', count=entries)
+        return values.astype(dtype)
+
+    def load_columns(self, name):
+        entry = self.manifest[name]
+        key = (os.path.abspath(self.cache_folder), name, entry['size'], entry['mtime'])
+        if key in loaded_trees and all(branch in loaded_trees[key].columns for branch in self.analyze_info.branch_names):
+            return loaded_trees[key]
+        columns = {branch: numpy.load(self.column_name(name, branch), mmap_mode='r') for branch in self.analyze_info.branch_names}
+        loaded_trees[key] = CachedTree(name, columns, entry['entries'])
+        return loaded_trees[key]
+
+    def load_trees(self):
+        '''
+        :return: dictionary with the sample name and a CachedTree with its columns. Samples whose root file changed
+        (or that were never converted) are converted first.
+        '''
+        files = self.source_files()
+        for name in sorted(files.keys()):
+            if not self.is_valid(name, files[name]):
+                self.convert(name, files[name])
+        return {name: self.load_columns(name) for name in files.keys()}
@@ -3,13 +3,21 @@
 #   author: Pin-Jung Diego Alejandro
 # ---------------------------------------------------
 
-from ROOT import TFile, THStack, TColor, TCanvas, TPad, gROOT, gPad, RooFit, RooWorkspace, RooRealVar, RooGaussian, RooPlot, kTRUE, kFALSE, TMath, TH1F, TRandom3, gStyle, TFile, TLine, Math
+from ROOT import TFile, THStack, TColor, TCanvas, TPad, gROOT, gPad, RooFit, RooWorkspace, RooRealVar, RooGaussian, RooPlot, kTRUE, kFALSE, TMath, TH1F, gStyle, TFile, TLine, Math
 from glob import glob
 from copy import deepcopy
 from DataTree import *
 from AnalyzeInfo import *
 from ToyExperimentGen import *
 from ProfileL import *
+from Likelihood import *
+from ParallelToyFit import *
+from QAccumulator import *
+from Asymptotic import *
+from EventCache import *
+from TemplateCache import *
+from AnalysisReport import *
+from RandomStreams import *
 from numpy import *
 from array import array
 
@@ -19,16 +27,25 @@ from Utils import *
 
 class Analysis:
     # this method is the initialization of the Analysis class. This is the constructor of the Analysis class.
-    def __init__(self, analyzeInfo):
+    def __init__(self, analyzeInfo, shared=None):
         '''
         :param self: it menas that it takes itself as parameter to initialize
+        :param shared: SharedSamples object. If it is given, its trees and DataTree objects are used instead of loading
+        the samples again (see MultiMassAnalysis)
         :return: this method does not return anything, it is just the constructor.
         '''
 
         # This is the folder name where the data is stored. Download it from the student forum page in moodle and save the data in the same path of this projekt
         self.DataFolder = 'l3higgs189/'
+        # Folder where the branches of each root file are stored as numpy arrays after the first run (see EventCache)
+        self.CacheFolder = 'l3higgs189_cache/'
+        # Folder where the filled histograms of each configuration are kept (see TemplateCache)
+        self.TemplateFolder = 'l3higgs189_templates/'
         self.analyze_info = analyzeInfo
+        self.shared = shared
         self.is_mute = self.analyze_info.silent_analysis
+        # time of each stage and counters of the work done (see analysis_report)
+        self.report = AnalysisReport(self.is_mute)
         if self.analyze_info.monte_carlo_to_analyse == '85':
             self.s_ini = 5.727142510004342
         elif self.analyze_info.monte_carlo_to_analyse == '90':
@@ -37,50 +54,92 @@ class Analysis:
             self.s_ini = 2.016040261602029
         # This calls the method 'load_trees' of the Analysis class, and the results are stored in the variable trees.
         # trees variable will have a dictionary with the tree name and the tree
-        if not self.is_mute:
-            print_banner('Loading names of trees...', '%')
-        self.names = self.get_names_trees()
-        if not self.is_mute:
-            print_banner('Loading trees...', '%')
-        self.trees = self.load_trees()
+        self.stage('names', 'Loading names of trees...')
+        self.names = self.get_names_trees() if self.shared is None else self.shared.names
+        self.stage('trees', 'Loading trees...')
+        if self.shared is not None:
+            self.trees = self.shared.trees
+        elif self.analyze_info.use_event_cache:
+            self.trees = EventCache(self.analyze_info, self.DataFolder, self.CacheFolder).load_trees()
+        else:
+            self.trees = self.load_trees()
         self.data_name = 'data'
         self.data_tree = ''
         self.background_trees = {}
         self.background_names = []
         self.mc_higgs_trees = {}
         self.mc_higgs_names = []
-        if not self.is_mute:
-            print_banner('Organizing trees on background, data, and MC...', '%')
+        self.stage('organize', 'Organizing trees on background, data, and MC...')
         self.organize_trees(self.trees, self.names)
-        self.cross_sections = {'eeqq': 15600, 'qq': 102, 'wen': 2.9, 'ww': 16.5, 'zee': 3.35, 'zz': 0.975, '85': 0.094, '90': 0.0667, '95': 0.0333}
-        self.num_events = {'eeqq': 5940000, 'qq': 200000, 'wen': 81786, 'ww': 294500, 'zee': 29500, 'zz': 196000, '85': 3972, '90': 3973, '95': 3971}
-        self.random = TRandom3(123654)
-        self.data_data_tree = DataTree(self.analyze_info, self.data_tree, 'data', -1, -1, self.random)
+        self.cross_sections = self.analyze_info.cross_sections
+        self.num_events = self.analyze_info.num_events
+        # the toys of each sample come from their own stream (seed, sample, mass), see RandomStreams
+        self.random_streams = RandomStreams(self.analyze_info.toy_seed)
+        if self.shared is not None:
+            self.template_cache = self.shared.template_cache
+        elif self.analyze_info.use_template_cache:
+            self.template_cache = TemplateCache(self.analyze_info, self.DataFolder, self.TemplateFolder)
+        else:
+            self.template_cache = None
+        # dictionary with the sample name and the counters of its DataTree when this Analysis got it, (0, 0) unless it
+        # was reused from SharedSamples, so the report only counts the work done for this Analysis
+        self.data_tree_counters = {}
+        self.stage('data')
+        self.data_data_tree = self.make_data_tree('data', -1, -1)
         self.data_histogram = self.data_data_tree.branches_histograms[self.analyze_info.test_statistics_branch]
-        if not self.is_mute:
-            print_banner('Loading branches information and settings...', '%')
+        self.stage('settings', 'Loading branches information and settings...')
         self.branch_names = self.analyze_info.branch_names
         self.branch_numbins = self.analyze_info.branch_numbins
         self.branch_mins = self.analyze_info.branch_min
         self.branch_maxs = self.analyze_info.branch_max
-        if not self.is_mute:
-            print_banner('Totaling the histograms of the backgrounds for each branch...', '%')
+        self.stage('backgrounds', 'Totaling the histograms of the backgrounds for each branch...')
         self.background_data_trees = self.create_background_data_trees()
         self.total_background_histograms_dict = self.totalBackgrounds(self.background_names, self.background_data_trees, self.branch_names, self.branch_numbins, self.branch_mins, self.branch_maxs)
         self.total_background_toy_histograms_dict = self.totalToyBackgrounds(self.background_names, self.background_data_trees, self.analyze_info.test_statistics_branch, self.branch_numbins, self.branch_mins, self.branch_maxs)
-        if not self.is_mute:
-            print_banner('Creating histograms for each MC...', '%')
+        self.stage('mc', 'Creating histograms for each MC...')
         self.mc_higgs_data_trees = self.create_mc_data_trees()
         self.mc_histograms_dict = self.monteCarloHistograms(self.mc_higgs_names, self.mc_higgs_data_trees, self.branch_names, self.branch_numbins, self.branch_mins, self.branch_maxs)
         self.mc_toy_histograms_dict = self.monteCarloToyHistograms(self.mc_higgs_names, self.mc_higgs_data_trees, self.analyze_info.test_statistics_branch, self.branch_numbins, self.branch_mins, self.branch_maxs)
-        self.profile_likelihoods_list = []
+        self.q_accumulator = QAccumulator()
         self.stuff = []
+        self.report.stop()
+        self.analysis_report().print_report()
         #   self.stack = self.stacked_histograms(self.norm_histograms[self.names], 'mmis')
 
     def __del__(self):
         if not self.is_mute:
             print 'Deleting', self
 
+    def stage(self, name, banner=None):
+        # starts the stage 'name' of the report, printing its banner
+        if banner is not None and not self.is_mute:
+            print_banner(banner, '%')
+        self.report.start(name)
+
+    def analysis_report(self, filename=None):
+        '''
+        :param filename: JSON file where the report is written. By default it is not written
+        :return: the AnalysisReport with the counters of the DataTree objects updated (their histograms are made when
+        they are used, so the counters grow after the construction of the Analysis)
+        '''
+        data_trees = [('data', self.data_data_tree)] + self.background_data_trees.items() + self.mc_higgs_data_trees.items()
+        samples = {}
+        for name, data_tree in data_trees:
+            # a DataTree reused from SharedSamples only counts the work done since this Analysis got it, and its toys
+            # were made for another Analysis
+            events_scanned, histograms_made = self.data_tree_counters.get(name, (0, 0))
+            samples[name] = {'events': data_tree.tree_entries, 'events_scanned': data_tree.events_scanned - events_scanned,
+                             'histograms': data_tree.histograms_made - histograms_made,
+                             'toys': len(data_tree.toys) if name != 'data' and not self.is_reused(name) else 0,
+                             'reused': int(self.is_reused(name))}
+            self.report.set_sample(name, **samples[name])
+        self.report.counters['events_scanned'] = sum(counters['events_scanned'] for counters in samples.values())
+        self.report.counters['histograms'] = sum(counters['histograms'] for counters in samples.values()) + len(self.total_background_histograms_dict.made)
+        self.report.counters['toys'] = sum(counters['toys'] for counters in samples.values())
+        if filename is not None:
+            self.report.write(filename)
+        return self.report
+
     def get_names_trees(self):
         files = glob('{dir}*.root'.format(dir=self.DataFolder))
         names = [i.split('/')[-1].strip('.root').split('higgs_')[-1] for i in files]
@@ -113,23 +172,42 @@ class Analysis:
                 self.background_trees[name] = dic_trees[name]
                 self.background_names.append(name)
 
+    def make_data_tree(self, name, cross_section, num_events):
+        if self.shared is not None:
+            built = self.shared.built
+            data_tree = self.shared.data_tree(self.analyze_info, name, cross_section, num_events, self.random_streams)
+            if self.shared.built == built:
+                self.data_tree_counters[name] = (data_tree.events_scanned, data_tree.histograms_made)
+            return data_tree
+        return DataTree(self.analyze_info, self.trees[name], name, cross_section, num_events, self.random_streams, None, self.template_cache)
+
+    def is_reused(self, name):
+        return name in self.data_tree_counters
+
     def create_background_data_trees(self):
-        dic = {name: DataTree(self.analyze_info, self.background_trees[name], name, self.cross_sections[name], self.num_events[name], self.random) for name in self.background_names}
-        return deepcopy(dic)
+        # the DataTree objects are not copied: their histograms and toys are only read by the Analysis (and shared with
+        # the other Analysis when they come from SharedSamples)
+        return {name: self.make_data_tree(name, self.cross_sections[name], self.num_events[name]) for name in self.background_names}
 
     def create_mc_data_trees(self):
-        dic = {name: DataTree(self.analyze_info, self.mc_higgs_trees[name], name, self.cross_sections[name], self.num_events[name], self.random) for name in self.mc_higgs_names}
-        return deepcopy(dic)
+        return {name: self.make_data_tree(name, self.cross_sections[name], self.num_events[name]) for name in self.mc_higgs_names}
 
     def totalBackgrounds(self, names, data_trees, branches_names, branches_nbins, branches_mins, branches_maxs):
-        total_background_histograms_dict = {}
-        for branch in branches_names:
-            self.accumulateHistogram(total_background_histograms_dict, names, data_trees, branch, branches_nbins[branch], branches_mins[branch], branches_maxs[branch])
-        return deepcopy(total_background_histograms_dict)
+        # the total of a branch is made the first time it is used, the histogram_branches are made now
+        def total_branches(branches):
+            for name in names:
+                data_trees[name].branches_histograms.fill(branches)
+            total_background_histograms_dict = {}
+            for branch in branches:
+                self.accumulateHistogram(total_background_histograms_dict, names, data_trees, branch, branches_nbins[branch], branches_mins[branch], branches_maxs[branch])
+            return total_background_histograms_dict
+        total = LazyHistograms(branches_names, lambda branch: total_branches([branch])[branch], total_branches)
+        return total.fill(self.analyze_info.histogram_branches())
 
     def totalToyBackgrounds(self, names, data_trees, branch, branches_nbins, branches_mins, branches_maxs):
-        total_toy_background_histogram = {i: self.accumulateToyHistogram(names, data_trees, branch, branches_nbins[branch], branches_mins[branch], branches_maxs[branch], i) for i in xrange(self.analyze_info.number_toys)}
-        return deepcopy(total_toy_background_histogram)
+        # ToyEnsemble whose toy i is the sum of the scaled toys i of all the backgrounds
+        return ToyEnsemble.sum([data_trees[name].toys.scaled(data_trees[name].scaling_factor) for name in names],
+                               branch + '_toy_background')
 
 
     def accumulateHistogram(self, dictionary, names, data_trees, branch_name, branch_nbin, branch_min, branch_max):
@@ -138,38 +216,29 @@ class Analysis:
         hmax = branch_max + float(branch_max - branch_min) / float(2 * branch_nbin)
         histo_name = branch_name + '_background'
         h1 = TH1F(histo_name, histo_name, nbins, hmin, hmax)
+        h1.SetDirectory(0)
         h1.SetBinErrorOption(TH1F.kPoisson)
         for name in names:
             h2 = data_trees[name].branches_histograms[branch_name]
             h1.Add(h2)
         dictionary[branch_name] = h1
 
-    def accumulateToyHistogram(self, names, data_trees, branch_name, branch_nbin, branch_min, branch_max, number):
-        nbins = int(branch_nbin + 1)
-        hmin = branch_min - float(branch_max - branch_min) / float(2 * branch_nbin)
-        hmax = branch_max + float(branch_max - branch_min) / float(2 * branch_nbin)
-        histo_name = branch_name + '_toy_background_'+str(number)
-        h1 = TH1F(histo_name, histo_name, nbins, hmin, hmax)
-        h1.SetBinErrorOption(TH1F.kPoisson)
-        for name in names:
-            h2 = data_trees[name].toys[number]
-            h1.Add(h2, data_trees[name].scaling_factor)
-        return deepcopy(h1)
-
     def monteCarloHistograms(self, names, data_trees, branch_names, branches_nbins, branches_mins, branches_maxs):
-        mc_histograms_dict = {name: {branch: data_trees[name].branches_histograms[branch] for branch in branch_names} for name in names}
+        # the histograms of a branch are made the first time they are used, the histogram_branches are made now
+        def mc_histogram(name, branch):
+            # the scaled histogram of the DataTree itself, not a copy
+            histogram = data_trees[name].branches_histograms[branch]
+            histogram.SetBinErrorOption(TH1F.kPoisson)
+            return histogram
+        mc_histograms_dict = {name: LazyHistograms(branch_names, lambda branch, name=name: mc_histogram(name, branch)) for name in names}
         for name in names:
-            for branch in branch_names:
-                mc_histograms_dict[name][branch].SetBinErrorOption(TH1F.kPoisson)
-        return deepcopy(mc_histograms_dict)
+            data_trees[name].branches_histograms.fill(self.analyze_info.histogram_branches())
+            mc_histograms_dict[name].fill(self.analyze_info.histogram_branches())
+        return mc_histograms_dict
 
     def monteCarloToyHistograms(self, names, data_trees, branch,  branches_nbins, branches_mins, branches_maxs):
-        mc_toy_histogram_dict = {name: {i: data_trees[name].toys[i] for i in xrange(self.analyze_info.number_toys)} for name in names}
-        for name in names:
-            for num in xrange(self.analyze_info.number_toys):
-                mc_toy_histogram_dict[name][num].SetBinErrorOption(TH1F.kPoisson)
-                mc_toy_histogram_dict[name][num].Scale(data_trees[name].scaling_factor)
-        return deepcopy(mc_toy_histogram_dict)
+        # ToyEnsemble of each MC, scaled to the data luminosity
+        return {name: data_trees[name].toys.scaled(data_trees[name].scaling_factor) for name in names}
 
 
     def overlayMCBckgrndSignal(self, mcname, branchname, doLogY=kFALSE):
@@ -249,20 +318,99 @@ class Analysis:
     def efficiency(self, branchname):
         return float(self.integral_signal(branchname))/float(self.s_ini)
 
-    def generate_toy_experiments(self, type, branchname, num):
-        name = type + '_' + branchname
-        if type == 'signal':
-            histo = self.mc_histograms_dict[self.analyze_info.monte_carlo_to_analyse][branchname]
-        else:
-            histo = self.total_background_histograms_dict[branchname]
-        return {i: ToyExperimentGen(self.analyze_info, histo, branchname, self.random, i, name) for i in xrange(num)}
+    def histogram_bytes(self, histogram):
+        # contents (float) and, if the histogram was scaled, sum of the squared weights (double) of all the bins
+        return histogram.GetNcells() * 4 + histogram.GetSumw2N() * 8
+
+    def memory_report(self):
+        '''
+        :return: dictionary with the bytes of the histograms and toys kept by the Analysis, and 'copies_avoided': an
+        estimate of the bytes of the deepcopies of the DataTree dictionaries, of the totals and of the MC histograms
+        made before, counting each histogram once (the MC histograms are those of the DataTree). The histograms of the
+        branches that were not used are not made, so they are not counted
+        '''
+        data_trees = self.background_data_trees.values() + self.mc_higgs_data_trees.values()
+        # dictionaries with the id and the histogram, so a histogram reached in several ways is counted once
+        templates = {id(histogram): histogram for data_tree in data_trees + [self.data_data_tree]
+                     for histograms in (data_tree.branches_histogram_no_norm, data_tree.branches_histograms)
+                     for histogram in histograms.made.values()}
+        totals = {id(histogram): histogram for histogram in self.total_background_histograms_dict.made.values()}
+        copied = {id(histogram): histogram for data_tree in data_trees
+                  for histograms in (data_tree.branches_histogram_no_norm, data_tree.branches_histograms)
+                  for histogram in histograms.made.values()}
+        copied.update(totals)
+        copied.update((id(histogram), histogram) for histograms in self.mc_histograms_dict.values() for histogram in histograms.made.values())
+        toys = sum(data_tree.toys.nbytes() for data_tree in data_trees)
+        templates_bytes = sum(self.histogram_bytes(histogram) for histogram in templates.values())
+        totals_bytes = sum(self.histogram_bytes(histogram) for histogram in totals.values())
+        return {'templates': templates_bytes, 'totals': totals_bytes, 'toys': toys, 'kept': templates_bytes + totals_bytes + toys,
+                'copies_avoided': sum(self.histogram_bytes(histogram) for histogram in copied.values()) + toys}
+
+    def print_memory_report(self):
+        report = self.memory_report()
+        for key in ('templates', 'totals', 'toys', 'kept', 'copies_avoided'):
+            print '{key}: {mb:.3f} MB{note}'.format(key=key, mb=report[key] / 1048576., note=' (estimate)' if key == 'copies_avoided' else '')
+
+    def templates_likelihood(self):
+        # likelihood of the background and signal templates, with the bins used by ProfileL
+        nbins = self.branch_numbins[self.analyze_info.test_statistics_branch]
+        background = self.total_background_histograms_dict[self.analyze_info.test_statistics_branch]
+        signal = self.mc_histograms_dict[self.analyze_info.monte_carlo_to_analyse][self.analyze_info.test_statistics_branch]
+        return PoissonLikelihood([background.GetBinContent(bin) for bin in xrange(1, nbins + 1)],
+                                 [signal.GetBinContent(bin) for bin in xrange(1, nbins + 1)])
+
+    def toys_likelihood(self):
+        # likelihood and toys (background, signal+background) with the bins used by ProfileL
+        nbins = self.branch_numbins[self.analyze_info.test_statistics_branch]
+        likelihood = self.templates_likelihood()
+        toys_bkg = self.total_background_toy_histograms_dict.contents()[:, :nbins]
+        toys_sgnbkg = toys_bkg + self.mc_toy_histograms_dict[self.analyze_info.monte_carlo_to_analyse].contents()[:, :nbins]
+        return likelihood, toys_bkg, toys_sgnbkg
+
+    def asymptotic_limit(self):
+        # q0, q_mu and CLs from the Asimov datasets of the templates and from the data, without toys
+        nbins = self.branch_numbins[self.analyze_info.test_statistics_branch]
+        return AsymptoticLimit(self.templates_likelihood(), [self.data_histogram.GetBinContent(bin) for bin in xrange(1, nbins + 1)])
+
+    def print_fit_failures(self):
+        failed = int((~self.mu_hat_bkg_converged).sum() + (~self.mu_hat_sgnbkg_converged).sum())
+        if failed and not self.is_mute:
+            print 'The fit of mu did not converge for', failed, 'toys'
+
+    def fit_toys_parallel(self, mu_excl=1):
+        # q values of all the toys, fitted at once in chunks by analyze_info.number_workers processes, or in this process
+        # with one worker (see ParallelToyFit)
+        likelihood, toys_bkg, toys_sgnbkg = self.toys_likelihood()
+        fit = ParallelToyFit(likelihood.background, likelihood.signal, toys_bkg, toys_sgnbkg, mu_excl,
+                             workers=self.analyze_info.number_workers, chunk_size=self.analyze_info.toys_chunk_size)
+        values = fit.run()
+        self.mu_hat_bkg, self.mu_hat_bkg_converged = values['mu_hat_bkg'], values['converged_bkg']
+        self.mu_hat_sgnbkg, self.mu_hat_sgnbkg_converged = values['mu_hat_sgnbkg'], values['converged_sgnbkg']
+        self.print_fit_failures()
+        self.report.add('nll_evaluations', values['nll_evaluations'])
+        self.report.add('fit_iterations', values['fit_iterations'])
+        self.q_accumulator.add(values['q0h0'], values['q0h1'], values['qeh0'], values['qeh1'])
 
     def calculate_profile_L_objects(self, mu_excl=1):
-        self.profile_likelihoods_list=[ProfileL(self.analyze_info, self.total_background_toy_histograms_dict[i],
-                                                self.mc_toy_histograms_dict[self.analyze_info.monte_carlo_to_analyse][i],
-                                                self.total_background_histograms_dict[self.analyze_info.test_statistics_branch],
-                                                self.mc_histograms_dict[self.analyze_info.monte_carlo_to_analyse][self.analyze_info.test_statistics_branch],
-                                                mu_excl,1) for i in xrange(self.analyze_info.number_toys)]
+        # the q values of the toys go to the QAccumulator, the ProfileL objects are not kept
+        self.q_accumulator = QAccumulator()
+        self.report.start('fit_toys')
+        if self.analyze_info.mu_fit_method == 'newton':
+            self.fit_toys_parallel(mu_excl)
+        else:
+            # Minuit fits one toy at a time. The toys are given as the rows of the ToyEnsemble arrays, no TH1F is made
+            toys_bkg = self.total_background_toy_histograms_dict.contents()
+            toys_sgn = self.mc_toy_histograms_dict[self.analyze_info.monte_carlo_to_analyse].contents()
+            for i in xrange(self.analyze_info.number_toys):
+                profile_likelihood = ProfileL(self.analyze_info, toys_bkg[i], toys_sgn[i],
+                                              self.total_background_histograms_dict[self.analyze_info.test_statistics_branch],
+                                              self.mc_histograms_dict[self.analyze_info.monte_carlo_to_analyse][self.analyze_info.test_statistics_branch],
+                                              mu_excl, 1)
+                self.q_accumulator.add(profile_likelihood.q0_bkg, profile_likelihood.q0_sgnbkg, profile_likelihood.qe_bkg, profile_likelihood.qe_sgnbkg)
+                self.report.add_profile(profile_likelihood.nll_evaluations, profile_likelihood.minuit_calls, profile_likelihood.fit_iterations)
+        self.report.add('toys_fitted', self.analyze_info.number_toys)
+        self.report.stop()
+        # only the toys written for plotting are made into TH1F
         fileToys = TFile('histo_toys_{mc}.root'.format(mc=self.analyze_info.monte_carlo_to_analyse), 'RECREATE')
         for i in xrange(0,self.analyze_info.number_toys,100):
             self.mc_toy_histograms_dict[self.analyze_info.monte_carlo_to_analyse][i].Write()
@@ -270,7 +418,8 @@ class Analysis:
         fileToys.Close()
 
     def calculate_q_data(self, mu_excl=1):
-        self.data_signal_histogram = deepcopy(self.data_histogram)
+        self.data_signal_histogram = self.data_histogram.Clone('data_signal')
+        self.data_signal_histogram.SetDirectory(0)
         self.data_signal_histogram.Add(self.total_background_histograms_dict[self.analyze_info.test_statistics_branch],-1)
         self.data_signal_histogram.Scale(float(1)/float(mu_excl))
         self.profile_likelihood_data = ProfileL(self.analyze_info,
@@ -281,28 +430,19 @@ class Analysis:
 
     def create_q_histograms(self, mu_excl=1, max_bin_value=-1, doLogY=kTRUE):
         self.calculate_profile_L_objects(mu_excl)
+        self.fill_q_histograms(mu_excl, max_bin_value, doLogY)
+
+    def fill_q_histograms(self, mu_excl=1, max_bin_value=-1, doLogY=kTRUE):
+        # q of the data and histograms of the q of the toys already in the QAccumulator (see calculate_profile_L_objects)
         self.calculate_q_data(mu_excl)
         self.q0data_bkg = self.profile_likelihood_data.q0_bkg
         self.qedata_sgnbkg = self.profile_likelihood_data.qe_sgnbkg
         if max_bin_value == -1:
-            max_bin_q0h0 = self.search_maximum_value_q('q0h0')
-            max_bin_q0h1 = self.search_maximum_value_q('q0h1')
-            max_bin_qeh0 = self.search_maximum_value_q('qeh0')
-            max_bin_qeh1 = self.search_maximum_value_q('qeh1')
-            max00 = amax([max_bin_q0h0, max_bin_q0h1])
-            max0 = amax([max00, self.q0data_bkg])
-            maxee = amax([max_bin_qeh0, max_bin_qeh1])
-            maxe = amax([maxee, self.qedata_sgnbkg])
-
-            min_bin_q0h0 = self.search_minimum_value_q('q0h0')
-            min_bin_q0h1 = self.search_minimum_value_q('q0h1')
-            min_bin_qeh0 = self.search_minimum_value_q('qeh0')
-            min_bin_qeh1 = self.search_minimum_value_q('qeh1')
-            min00 = amin([min_bin_q0h0, min_bin_q0h1])
-            min0 = amin([min00, self.q0data_bkg])
-            minee = amin([min_bin_qeh0, min_bin_qeh1])
-            mine = amin([minee, self.qedata_sgnbkg])
-
+            # 0 and 100000 bound the ranges, as in the old search of the maximum and the minimum
+            max0 = amax([self.q_accumulator.maximum(('q0h0', 'q0h1')), 0, self.q0data_bkg])
+            maxe = amax([self.q_accumulator.maximum(('qeh0', 'qeh1')), 0, self.qedata_sgnbkg])
+            min0 = amin([self.q_accumulator.minimum(('q0h0', 'q0h1')), 100000, self.q0data_bkg])
+            mine = amin([self.q_accumulator.minimum(('qeh0', 'qeh1')), 100000, self.qedata_sgnbkg])
         else:
             max0 = max_bin_value
             maxe = max_bin_value
@@ -338,11 +478,10 @@ class Analysis:
         self.hqeh1.SetBinErrorOption(TH1F.kPoisson)
         self.hqeh1.SetStats(kFALSE)
         self.hqeh1.SetMaximum(numtoys)
-        for i in xrange(self.analyze_info.number_toys):
-            self.hq0h0.Fill(self.profile_likelihoods_list[i].q0_bkg)
-            self.hq0h1.Fill(self.profile_likelihoods_list[i].q0_sgnbkg)
-            self.hqeh0.Fill(self.profile_likelihoods_list[i].qe_bkg)
-            self.hqeh1.Fill(self.profile_likelihoods_list[i].qe_sgnbkg)
+        self.q_accumulator['q0h0'].fill(self.hq0h0)
+        self.q_accumulator['q0h1'].fill(self.hq0h1)
+        self.q_accumulator['qeh0'].fill(self.hqeh0)
+        self.q_accumulator['qeh1'].fill(self.hqeh1)
         fileq = TFile('histos_q_{mc}.root'.format(mc=self.analyze_info.monte_carlo_to_analyse), "RECREATE")
         self.hq0h0.Write()
         self.hq0h1.Write()
@@ -384,68 +523,21 @@ class Analysis:
 
     def searchMedian(self, mu_excl=1, max_bin_value=-1, doLogY=kTRUE):
         self.create_q_histograms(mu_excl, max_bin_value, doLogY)
-        a1 = linspace(0, 1, 3)
-        b1 = array('d', [0]*3)
-        self.hqeh0.GetQuantiles(3, b1, a1)
-        self.hmedian = b1[1]
+        # median of the q_mu of the background toys, exact up to QStream.max_exact toys
+        self.hmedian = self.q_accumulator['qeh0'].quantile(0.5)
 
     def search_pvalues(self, mu_excl=1, max_bin_value=-1, doLogY=kTRUE):
         self.create_q_histograms(mu_excl, max_bin_value, doLogY)
-        a1 = linspace(0, 1, 2001)
-        b1 = array('d', [0]*2001)
-        self.p_val_sb = -1
-        self.hqeh1.GetQuantiles(2001, b1, a1)
-        for i in linspace(2000, 0, 2001):
-            if int(self.p_val_sb) == -1 and b1[int(i)] < self.qedata_sgnbkg:
-                self.p_val_sb = 1-a1[int(i)]
-        if self.p_val_sb == -1:
-            self.p_val_sb = 1-a1[0]
-        b2 = array('d', [0]*2001)
-        self.p_val_b = -1
-        self.hqeh0.GetQuantiles(2001, b2, a1)
-        for i in linspace(0,2000, 2001):
-            if int(self.p_val_b) == -1 and b2[int(i)] > self.qedata_sgnbkg:
-                self.p_val_b = a1[int(i)]
-        if self.p_val_b == -1:
-            self.p_val_b = a1[-1]
-        if self.p_val_b == 1:
-            self.cls = 0
-        else:
-            self.cls = float(self.p_val_sb)/float(1-self.p_val_b)
-        print 'With a CL of {val}%, we can exclude the s+b with mu = 1'.format(val=100*(1-self.cls))
-
-
-    def search_maximum_value_q(self, variable):
-        max = 0
-        for i in xrange(self.analyze_info.number_toys):
-            if variable == 'q0h0':
-                value = self.profile_likelihoods_list[i].q0_bkg
-            elif variable == 'q0h1':
-                value = self.profile_likelihoods_list[i].q0_sgnbkg
-            elif variable == 'qeh0':
-                value = self.profile_likelihoods_list[i].qe_bkg
-            else:
-                value = self.profile_likelihoods_list[i].qe_sgnbkg
-            if value > max:
-                max = value
-        return max
-
-    def search_minimum_value_q(self,variable):
-        min = 100000
-        for i in  xrange(self.analyze_info.number_toys):
-            if variable == 'q0h0':
-                value = self.profile_likelihoods_list[i].q0_bkg
-            elif variable == 'q0h1':
-                value = self.profile_likelihoods_list[i].q0_sgnbkg
-            elif variable == 'qeh0':
-                value = self.profile_likelihoods_list[i].qe_bkg
-            else:
-                value = self.profile_likelihoods_list[i].qe_sgnbkg
-                if value < min:
-                    min = value
-        return min
-
-
+        self.calculate_pvalues(mu_excl)
+
+    def calculate_pvalues(self, mu_excl=1):
+        # p-values of the q of the data found by fill_q_histograms: tail fractions of the sorted q_mu of the toys, they
+        # do not depend on bins_q_histos (see QAccumulator.cls)
+        pvalues = self.q_accumulator.cls(self.qedata_sgnbkg)
+        self.p_val_sb, self.p_val_sb_error = float(pvalues['p_sb']), float(pvalues['p_sb_error'])
+        self.p_val_b, self.p_val_b_error = float(pvalues['p_b']), float(pvalues['p_b_error'])
+        self.cls, self.cls_error = float(pvalues['cls']), float(pvalues['cls_error'])
+        print 'With a CL of {val}% (+- {err}%), we can exclude the s+b with mu = {mu}'.format(val=100*(1-self.cls), err=100*self.cls_error, mu=mu_excl)
 
 
 # This is the main that it is called if you start the python script
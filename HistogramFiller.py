@@ -0,0 +1,101 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from Cuts import *
+from AnalyzeInfo import *
+from numpy import errstate, floor, bincount, isnan, zeros
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class HistogramFiller:
+    def __init__(self, analyzeInfo, branch_names=None, chunk_size=-1):
+        '''
+        :param analyzeInfo: AnalyzeInfo object with the binning and the cuts of each branch
+        :param branch_names: branches whose histograms are filled. By default all the branches in analyzeInfo
+        :param chunk_size: number of events evaluated at once. By default analyzeInfo.fill_chunk_size
+        '''
+        self.analyze_info = analyzeInfo
+        self.branch_names = branch_names if branch_names is not None else self.analyze_info.branch_names
+        self.chunk_size = chunk_size if chunk_size != -1 else self.analyze_info.fill_chunk_size
+        self.cuts = Cuts(self.analyze_info)
+        self.binning = {branch: self.branch_binning(branch) for branch in self.branch_names}
+
+    def branch_binning(self, branch):
+        # same binning as DataTree.GetBranchHistogram: numbins+1 bins centered on branch_min ... branch_max
+        nbins = self.analyze_info.branch_numbins[branch]
+        bmin = self.analyze_info.branch_min[branch]
+        bmax = self.analyze_info.branch_max[branch]
+        hmin = float(bmin - float(bmax - bmin) / float(2 * nbins))
+        hmax = float(bmax + float(bmax - bmin) / float(2 * nbins))
+        return int(nbins + 1), hmin, hmax
+
+    def fill(self, columns, entries, mcname=None, mask=None):
+        '''
+        Scans the events once. In each chunk the selection of 'mcname' is evaluated once and all the branches are
+        filled with the selected events.
+        :param columns: dictionary with the branch name and a numpy array with its values for each event
+        :param entries: number of events in the columns
+        :param mcname: MC whose cuts are applied. By default analyzeInfo.monte_carlo_to_analyse
+        :param mask: boolean numpy array with the events that pass the cuts (see Selection). If it is given, the cuts
+        are not evaluated again
+        :return: (dictionary with the branch name and the counts of each bin including underflow and overflow, number
+        of selected events)
+        '''
+        mc = mcname if mcname is not None else self.analyze_info.monte_carlo_to_analyse
+        counts = {branch: zeros(self.binning[branch][0] + 2, dtype='int64') for branch in self.branch_names}
+        selected = 0
+        for start in xrange(0, entries, self.chunk_size):
+            stop = min(start + self.chunk_size, entries)
+            if mask is None:
+                chunk = {branch: columns[branch][start:stop] for branch in self.analyze_info.branch_names}
+                chunk_mask = self.cuts.getCutMask(mc, chunk)
+            else:
+                chunk = {branch: columns[branch][start:stop] for branch in self.branch_names}
+                chunk_mask = mask[start:stop]
+            selected += int(chunk_mask.sum())
+            for branch in self.branch_names:
+                counts[branch] += self.bin_counts(chunk[branch][chunk_mask], *self.binning[branch])
+        return counts, selected
+
+    def fill_masks(self, columns, entries, masks):
+        '''
+        Same as fill, for several selections in the same scan of the events: the bins of each event are computed once
+        and counted for every mask.
+        :param masks: list of boolean numpy arrays, e.g. the selections of several MC
+        :return: list with the (counts, number of selected events) of each mask, as fill
+        '''
+        results = [({branch: zeros(self.binning[branch][0] + 2, dtype='int64') for branch in self.branch_names}, 0) for mask in masks]
+        for start in xrange(0, entries, self.chunk_size):
+            stop = min(start + self.chunk_size, entries)
+            chunk_masks = [mask[start:stop] for mask in masks]
+            results = [(counts, selected + int(chunk_mask.sum())) for (counts, selected), chunk_mask in zip(results, chunk_masks)]
+            for branch in self.branch_names:
+                nbins, xmin, xmax = self.binning[branch]
+                bins = self.bin_indices(columns[branch][start:stop], nbins, xmin, xmax)
+                for (counts, selected), chunk_mask in zip(results, chunk_masks):
+                    counts[branch] += bincount(bins[chunk_mask], minlength=nbins + 2)
+        return results
+
+    def bin_indices(self, values, nbins, xmin, xmax):
+        # same binning as TH1::FindBin: bin 0 is the underflow and bin nbins+1 is the overflow
+        values = values.astype('float64')
+        with errstate(invalid='ignore'):
+            bins = floor(nbins * (values - xmin) / (xmax - xmin)).astype('int64') + 1
+            bins[values < xmin] = 0
+            bins[values >= xmax] = nbins + 1
+        # NaN is in the overflow, as in TAxis::FindBin, and not a negative index
+        bins[isnan(values)] = nbins + 1
+        return bins
+
+    def bin_counts(self, values, nbins, xmin, xmax):
+        return bincount(self.bin_indices(values, nbins, xmin, xmax), minlength=nbins + 2)
+
+    def fill_histogram(self, histogram, counts, entries):
+        for bin in xrange(len(counts)):
+            histogram.SetBinContent(bin, float(counts[bin]))
+        histogram.SetEntries(entries)
@@ -0,0 +1,234 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from numpy import abs, asarray, atleast_1d, atleast_2d, errstate, full, inf, log, maximum, minimum, nonzero, pi, where, zeros
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+# coefficients of the Lanczos approximation (g=7, n=9) of the gamma function
+lanczos_g = 7
+lanczos_coefficients = [0.99999999999980993, 676.5203681218851, -1259.1392167224028, 771.32342877765313,
+                        -176.61502916214059, 12.507343278686905, -0.13857109526572012, 9.9843695780195716e-6,
+                        1.5056327351493116e-7]
+
+
+def log_gamma(x):
+    '''
+    :param x: numpy array with values >= 0.5
+    :return: numpy array with ln(Gamma(x)), same as TMath::LnGamma
+    '''
+    x = asarray(x, dtype='float64') - 1
+    series = lanczos_coefficients[0]
+    for i in xrange(1, lanczos_g + 2):
+        series = series + lanczos_coefficients[i] / (x + i)
+    t = x + lanczos_g + 0.5
+    return 0.5 * log(2 * pi) + (x + 0.5) * log(t) - t + log(series)
+
+
+class PoissonLikelihood:
+    def __init__(self, background, signal):
+        '''
+        Binned Poisson likelihood of the observed counts t given the expectation b + mu * s in each bin.
+        :param background: numpy array with the expected background of each bin
+        :param signal: numpy array with the expected signal of each bin
+        '''
+        self.background = asarray(background, dtype='float64')
+        self.signal = asarray(signal, dtype='float64')
+        self.num_bins = len(self.background)
+        self.key = (self.background.tobytes(), self.signal.tobytes())
+        # counters of the work done (see AnalysisReport): nll of one toy at one mu computed by nll_at, and Newton
+        # iterations of one toy in fit_mu
+        self.nll_evaluations = 0
+        self.fit_iterations = 0
+
+    def expected(self, mus):
+        # numpy array (number of mu, number of bins) with b + mu * s
+        return self.background[None, :] + atleast_1d(asarray(mus, dtype='float64'))[:, None] * self.signal[None, :]
+
+    def log_factorials(self, counts):
+        return log_gamma(atleast_2d(asarray(counts, dtype='float64')) + 1)
+
+    def nll(self, counts, mus):
+        '''
+        -2 ln L(mu) = sum over the bins of -2 ln Poisson(t; b + mu * s) for many toys and many mu at once. The bins
+        where b + mu * s <= 0 are handled as follows:
+         - t = 0: the term is 2 * (b + mu * s), the limit of the Poisson formula (as TMath::Poisson)
+         - t > 0 and b + mu * s = 0: the bin is skipped, as ProfileL always did
+         - t > 0 and b + mu * s < 0: the term is +inf, such a mu is not allowed
+        :param counts: numpy array (number of toys, number of bins), or (number of bins) for a single toy
+        :param mus: numpy array with the values of mu
+        :return: numpy array (number of toys, number of mu)
+        '''
+        counts = atleast_2d(asarray(counts, dtype='float64'))
+        return self.nll_terms(counts, mus, self.log_factorials(counts)).sum(axis=2)
+
+    def nll_terms(self, counts, mus, log_factorials):
+        # numpy array (number of toys, number of mu, number of bins) with the term of each bin
+        return self.terms(counts[:, None, :], self.expected(mus)[None, :, :], log_factorials[:, None, :])
+
+    def nll_at(self, counts, mus, log_factorials=None):
+        '''
+        :param counts: numpy array (number of toys, number of bins)
+        :param mus: numpy array with one mu for each toy
+        :return: numpy array with nll of each toy at its own mu
+        '''
+        counts = atleast_2d(asarray(counts, dtype='float64'))
+        log_factorials = log_factorials if log_factorials is not None else self.log_factorials(counts)
+        self.nll_evaluations += len(counts)
+        m = self.background[None, :] + asarray(mus, dtype='float64')[:, None] * self.signal[None, :]
+        return self.terms(counts, m, log_factorials).sum(axis=1)
+
+    def terms(self, t, m, log_factorials):
+        # -2 ln Poisson(t; m) with the rules of nll for the bins with m <= 0. t, m and log_factorials are broadcast
+        with errstate(divide='ignore', invalid='ignore'):
+            terms = -2 * (t * log(where(m > 0, m, 1.)) - m - log_factorials)
+        terms = where(t == 0, 2 * m, terms)
+        terms = where((t > 0) & (m == 0), 0., terms)
+        return where((t > 0) & (m < 0), inf, terms)
+
+    def derivatives(self, counts, mus):
+        '''
+        :param counts: numpy array (number of toys, number of bins)
+        :param mus: numpy array with one mu for each toy
+        :return: first and second derivatives of nll with respect to mu, one for each toy
+        '''
+        m = self.background[None, :] + mus[:, None] * self.signal[None, :]
+        positive = m > 0
+        with errstate(divide='ignore', invalid='ignore'):
+            ratio = where(positive, counts / where(positive, m, 1.), 0.)
+        skipped = (counts > 0) & (m == 0)
+        first = 2 * where(skipped, 0., self.signal[None, :] * (1 - ratio)).sum(axis=1)
+        second = 2 * where(positive, ratio * self.signal[None, :] ** 2 / where(positive, m, 1.), 0.).sum(axis=1)
+        return first, second
+
+    def fit_mu(self, counts, min_mu=-1, max_mu=3, start=0.5, tolerance=1e-6, max_iterations=100):
+        '''
+        Minimizes nll in min_mu <= mu <= max_mu for all the toys at once. nll is convex in mu, so the minimum is either
+        a bound or the root of its first derivative, which is found with Newton steps kept inside a bracket that
+        shrinks at each iteration (a bisection step is used when Newton leaves the bracket).
+        :param counts: numpy array (number of toys, number of bins), or (number of bins) for a single toy
+        :return: (numpy array with mu-hat of each toy, boolean numpy array which is True where the fit converged)
+        '''
+        counts = atleast_2d(asarray(counts, dtype='float64'))
+        num_toys = len(counts)
+        # mu must keep b + mu * s > 0 in the bins with counts, otherwise nll is infinite
+        with errstate(divide='ignore', invalid='ignore'):
+            limits = where((counts > 0) & (self.signal[None, :] > 0), -self.background[None, :] / where(self.signal > 0, self.signal, 1.)[None, :], -inf).max(axis=1)
+        low = maximum(float(min_mu), limits)
+        high = full(num_toys, float(max_mu))
+        mu_hat = zeros(num_toys)
+        converged = zeros(num_toys, dtype=bool)
+        # minimum at the upper bound: nll still decreases at max_mu (or no mu in the range is allowed)
+        first_high = self.derivatives(counts, high)[0]
+        at_max = (first_high <= 0) | (low >= high)
+        # minimum at the lower bound: nll already increases at min_mu
+        first_low = self.derivatives(counts, low)[0]
+        at_min = ~at_max & (limits < min_mu) & (first_low >= 0)
+        mu_hat[at_max] = max_mu
+        mu_hat[at_min] = min_mu
+        converged[at_max | at_min] = True
+        converged[low >= high] = False
+        active = nonzero(~(at_max | at_min))[0]
+        mu = minimum(maximum(float(start), low[active]), high[active])
+        mu = where(mu > low[active], mu, 0.5 * (low[active] + high[active]))
+        for iteration in xrange(max_iterations):
+            if len(active) == 0:
+                break
+            self.fit_iterations += len(active)
+            first, second = self.derivatives(counts[active], mu)
+            low[active] = where(first < 0, mu, low[active])
+            high[active] = where(first > 0, mu, high[active])
+            with errstate(divide='ignore', invalid='ignore'):
+                newton = mu - first / second
+            inside = (second > 0) & (newton > low[active]) & (newton < high[active])
+            new_mu = where(inside, newton, 0.5 * (low[active] + high[active]))
+            done = (abs(new_mu - mu) < tolerance) | (high[active] - low[active] < tolerance) | (first == 0)
+            mu = where(first == 0, mu, new_mu)
+            mu_hat[active] = mu
+            converged[active[done]] = True
+            active = active[~done]
+            mu = mu[~done]
+        return mu_hat, converged
+
+    def q_values(self, counts, mu_excl=1, min_mu=-1, max_mu=3, fit=None):
+        '''
+        q0 (discovery) and q_mu (exclusion of mu_excl) of many toys at once, with the same rules as ProfileL:
+         - q0 = nll(0) - nll(mu-hat), or 0 if mu-hat < 0
+         - q_mu = nll(mu_excl) - nll(mu-hat), nll(mu_excl) - nll(0) if mu-hat < 0, or 0 if mu-hat > mu_excl
+        :param counts: numpy array (number of toys, number of bins)
+        :param fit: (mu-hat, converged) of these counts if they were already fitted, e.g. for another mu_excl
+        :return: (q0, q_mu, mu-hat, converged), numpy arrays with one value for each toy
+        '''
+        counts = atleast_2d(asarray(counts, dtype='float64'))
+        log_factorials = self.log_factorials(counts)
+        mu_hat, converged = fit if fit is not None else self.fit_mu(counts, min_mu, max_mu)
+        nll_zero = self.nll_at(counts, zeros(len(counts)), log_factorials)
+        nll_excl = self.nll_at(counts, full(len(counts), float(mu_excl)), log_factorials)
+        nll_hat = self.nll_at(counts, mu_hat, log_factorials)
+        with errstate(invalid='ignore'):
+            q0 = where(mu_hat < 0, 0., nll_zero - nll_hat)
+            q_mu = where(mu_hat < 0, nll_excl - nll_zero, where(mu_hat > mu_excl, 0., nll_excl - nll_hat))
+        return q0, q_mu, mu_hat, converged
+
+
+class ObservedLikelihood:
+    def __init__(self, likelihood, counts, max_cached=64):
+        '''
+        Likelihood of one set of observed counts (a toy or the data). The log-factorial of each bin, the values of nll
+        and the fitted mu-hat are computed once and kept.
+        :param likelihood: PoissonLikelihood with the templates
+        :param counts: numpy array with the counts of each bin
+        :param max_cached: number of values of nll that are kept (least recently used are dropped first)
+        '''
+        self.likelihood = likelihood
+        self.counts = atleast_2d(asarray(counts, dtype='float64'))
+        self.log_factorials = self.likelihood.log_factorials(self.counts)
+        self.nll_values = LRUCache(max_cached)
+        self.mu_hats = {}
+        self.nll_evaluations = 0
+
+    def nll(self, mu):
+        mu = float(mu)
+        value = self.nll_values.get(mu)
+        if value is None:
+            self.nll_evaluations += 1
+            value = self.nll_values.put(mu, float(self.likelihood.nll_terms(self.counts, [mu], self.log_factorials).sum()))
+        return value
+
+    def mu_hat(self, min_mu=-1, max_mu=3, start=0.5):
+        key = (float(min_mu), float(max_mu))
+        if key not in self.mu_hats:
+            mu, converged = self.likelihood.fit_mu(self.counts, min_mu, max_mu, start)
+            self.mu_hats[key] = (float(mu[0]), bool(converged[0]))
+        return self.mu_hats[key][0]
+
+    def set_mu_hat(self, mu, min_mu=-1, max_mu=3, converged=True):
+        # mu-hat fitted elsewhere, e.g. together with other toys
+        self.mu_hats[(float(min_mu), float(max_mu))] = (float(mu), converged)
+
+
+# likelihoods shared by all the ProfileL objects of the session
+likelihood_cache = LRUCache(16)
+observed_likelihood_cache = LRUCache(4096)
+
+
+def get_likelihood(background, signal):
+    '''
+    :return: the PoissonLikelihood of these templates, the same object as long as the templates do not change
+    '''
+    likelihood = PoissonLikelihood(background, signal)
+    return likelihood_cache.get(likelihood.key) or likelihood_cache.put(likelihood.key, likelihood)
+
+
+def get_observed_likelihood(likelihood, counts):
+    '''
+    :return: the ObservedLikelihood of these counts with the templates of likelihood, with all the values already
+    computed for them
+    '''
+    counts = asarray(counts, dtype='float64')
+    key = likelihood.key + (counts.tobytes(),)
+    return observed_likelihood_cache.get(key) or observed_likelihood_cache.put(key, ObservedLikelihood(likelihood, counts))
@@ -13,6 +13,8 @@ from ProfileL import *
 from numpy import *
 from optparse import OptionParser
 from HiggsProjekt import *
+from CLsLimit import *
+from MultiMassAnalysis import *
 import os
 
 
@@ -40,9 +42,11 @@ class MCHiggsScan:
         del self.analysis
 
     def allMC_q_Study(self, mu=1):
-        self.MC_q_Study('85', mu)
-        self.MC_q_Study('90', mu)
-        self.MC_q_Study('95', mu)
+        # the three masses share the samples, and the histograms and toys of the samples whose selection is the same
+        self.analyze_info.change_number_toys(self.ntoys)
+        self.multi_analysis = MultiMassAnalysis(self.analyze_info, ('85', '90', '95'))
+        for mc, analysis in self.multi_analysis.items():
+            analysis.create_q_histograms(mu, -1)
 
     def MC_q_Study(self, mc='85', mu=1):
         self.analyze_info.change_montecarlo_to_analyse(mc)
@@ -96,6 +100,59 @@ class MCHiggsScan:
             self.mu_old2 -= self.median_search_step
             self.search_cls(mc, self.mu_i2 - float(self.median_search_step), 500, alpha)
 
+    def cls_limit(self, mc='85', mu=1, numtoys=500, alpha=0.01, tolerance=0.01, batch_size=-1):
+        '''
+        Same search as search_cls, but the samples and the background toys are loaded only once (see CLsLimit).
+        :param numtoys: maximum number of toys of each mu
+        :param batch_size: with batch_size < numtoys, the toys of each mu are added in batches of batch_size only until
+        CLs is clearly above or below alpha
+        '''
+        self.analyze_info.change_number_toys(numtoys)
+        self.limit_engine = CLsLimit(self.analyze_info, mc, batch_size=batch_size)
+        self.limit, self.cls_curve = self.limit_engine.limit(alpha, mu, self.median_search_step, tolerance)
+        for mu_i, cls, cls_error in self.cls_curve:
+            print 'mu = {mu:.4f}: CLs = {cls:.4f} +- {err:.4f}'.format(mu=mu_i, cls=cls, err=cls_error)
+        print 'the mu for alpha = {al} is {lim} ({toys} toys in total)'.format(al=alpha, lim=self.limit, toys=self.limit_engine.toys_used())
+        return self.limit
+
+    def median_limit(self, mc='85', mu=1, numtoys=500, tolerance=0.01):
+        # same search as search_median with one Analysis
+        self.analyze_info.change_number_toys(numtoys)
+        self.limit_engine = CLsLimit(self.analyze_info, mc)
+        self.median_mu = self.limit_engine.median_limit(mu, self.median_search_step, tolerance)
+        print 'the median lies at mu = {mu}'.format(mu=self.median_mu)
+        return self.median_mu
+
+    def asymptotic_limit(self, mc='85', alpha=0.01):
+        # expected (median and bands) and observed upper limits from the asymptotic formulas, no toys are generated
+        self.analyze_info.change_montecarlo_to_analyse(mc)
+        self.analyze_info.change_number_toys(0)
+        self.analysis = Analysis(self.analyze_info)
+        self.asymptotic = self.analysis.asymptotic_limit()
+        expected = self.asymptotic.expected_limits(alpha)
+        significance = self.asymptotic.expected_significance()
+        for n in sorted(expected):
+            print 'expected {n:+d} sigma: mu = {mu:.4f}, Z0 = {z:.3f}'.format(n=n, mu=expected[n], z=significance[n])
+        self.limit = self.asymptotic.observed_limit(alpha)
+        print 'observed: mu = {mu} for alpha = {al}, p0 = {p0:.4f}'.format(mu=self.limit, al=alpha, p0=self.asymptotic.observed_p0())
+        return self.limit
+
+    def asymptotic_crosscheck(self, mc='85', mu=1, numtoys=1000, alpha=0.01, mus=(0.25, 0.5, 0.75, 1, 1.5, 2)):
+        # compares the CLs and the median q_mu of the background toys with the asymptotic ones, for the same Analysis
+        self.analyze_info.change_number_toys(numtoys)
+        self.limit_engine = CLsLimit(self.analyze_info, mc)
+        self.asymptotic = self.limit_engine.analysis.asymptotic_limit()
+        print_banner('Toys ({n}) against asymptotic formulas for Higgs {mc}'.format(n=numtoys, mc=mc))
+        print '{0:>8} {1:>20} {2:>12} {3:>14} {4:>14}'.format('mu', 'CLs toys', 'CLs asympt.', 'median q toys', 'median q asym.')
+        for mu_i in sorted(set(mus) | set([mu])):
+            toys = self.limit_engine.cls(mu_i)
+            asymptotic = self.asymptotic.observed_cls(mu_i)
+            print '{mu:8.3f} {cls:11.4f} +- {err:.4f} {acls:12.4f} {med:14.4f} {amed:14.4f}'.format(
+                mu=mu_i, cls=toys['cls'], err=toys['cls_error'], acls=asymptotic['cls'], med=toys['median_b'],
+                amed=self.asymptotic.expected_q_mu(mu_i, (0,))[0])
+        toys_limit = self.limit_engine.limit(alpha, mu, self.median_search_step)[0]
+        print 'upper limit for alpha = {al}: toys {t}, asymptotic {a}'.format(al=alpha, t=toys_limit, a=self.asymptotic.observed_limit(alpha))
+
     def calculate_CL_exclusion(self, mc='85', mu=1, numtoys=100):
         self.analyze_info.change_montecarlo_to_analyse(mc)
         self.analyze_info.change_number_toys(numtoys)
@@ -109,10 +166,27 @@ if __name__ == '__main__':
     parser.add_option('-m', '--mc', dest='mc', default='85', help='HiggsMC to analyse. e.g. 85')
     parser.add_option('-u', '--mu', dest='mu', default=1, type='float', help='mu value to analyse')
     parser.add_option('-n', '--ntoys', dest='ntoys', default=100, type='int', help='Number of toys')
+    parser.add_option('-j', '--workers', dest='workers', default=1, type='int', help='Number of processes fitting the toys. -1 for all the cores')
+    parser.add_option('-c', '--chunk', dest='chunk', default=1000, type='int', help='Number of toys fitted by each job')
+    parser.add_option('-l', '--limit', dest='limit', default=0, type='int', help='1 to compute the CLs upper limit on mu instead of the q study')
+    parser.add_option('-a', '--alpha', dest='alpha', default=0.01, type='float', help='CLs value of the upper limit')
+    parser.add_option('-t', '--tolerance', dest='tolerance', default=0.01, type='float', help='tolerance on mu of the upper limit')
+    parser.add_option('-b', '--batch', dest='batch', default=-1, type='int', help='toys of each batch of the upper limit. By default all the toys at once')
+    parser.add_option('-s', '--asymptotic', dest='asymptotic', default=0, type='int', help='1 to compute the upper limit with the asymptotic formulas')
+    parser.add_option('-x', '--crosscheck', dest='crosscheck', default=0, type='int', help='1 to compare the toys with the asymptotic formulas')
     (options, args) = parser.parse_args()
     mu = float(options.mu)
     mc = str(options.mc)
     ntoys = int(options.ntoys)
     a = AnalyzeInfo()
+    a.change_number_workers(int(options.workers))
+    a.change_toys_chunk_size(int(options.chunk))
     z = MCHiggsScan(a, mc, mu, ntoys)
-    z.MC_q_Study(z.mc, z.mu)
\ No newline at end of file
+    if options.asymptotic:
+        z.asymptotic_limit(z.mc, float(options.alpha))
+    elif options.crosscheck:
+        z.asymptotic_crosscheck(z.mc, z.mu, z.ntoys, float(options.alpha))
+    elif options.limit:
+        z.cls_limit(z.mc, z.mu, z.ntoys, float(options.alpha), float(options.tolerance), int(options.batch))
+    else:
+        z.MC_q_Study(z.mc, z.mu)
\ No newline at end of file
@@ -0,0 +1,45 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from HiggsProjekt import *
+from SharedSamples import *
+from collections import OrderedDict
+from copy import deepcopy
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class MultiMassAnalysis:
+    def __init__(self, analyzeInfo, masses=('85', '90', '95'), shared=None):
+        '''
+        One Analysis for each Higgs mass, built on the same SharedSamples: the samples are loaded once, the histograms
+        of the selections of all the masses are filled in one scan of each sample, and the histograms of a sample are
+        reused by all the masses whose selections are the same. The toys of each mass are those of an Analysis built
+        alone for it.
+        :param analyzeInfo: AnalyzeInfo object. Each mass gets its own copy with monte_carlo_to_analyse set to it
+        :param masses: Higgs MC to analyse
+        :param shared: SharedSamples object to use. By default the samples are loaded here
+        '''
+        self.masses = masses
+        self.analyze_infos = OrderedDict()
+        for mh in self.masses:
+            self.analyze_infos[mh] = deepcopy(analyzeInfo)
+            self.analyze_infos[mh].change_montecarlo_to_analyse(mh)
+        self.shared = shared if shared is not None else SharedSamples(analyzeInfo)
+        if not analyzeInfo.silent_analysis:
+            print_banner('Filling the selections of the Higgs {m}...'.format(m=', '.join(self.masses)), '%')
+        self.shared.prefill(self.analyze_infos.values())
+        self.analyses = OrderedDict((mh, Analysis(self.analyze_infos[mh], self.shared)) for mh in self.masses)
+        if not analyzeInfo.silent_analysis:
+            print '{b} DataTree built ({c} with the histograms of another mass) and {r} reused for {n} masses'.format(
+                b=self.shared.built, c=self.shared.counts_reused, r=self.shared.reused, n=len(self.masses))
+
+    def __getitem__(self, mh):
+        return self.analyses[mh]
+
+    def items(self):
+        return self.analyses.items()
@@ -0,0 +1,82 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from CutsScan import *
+from multiprocessing import Pool, cpu_count
+from optparse import OptionParser
+import time
+import os
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+def run_cuts_scan_job(job):
+    '''
+    Runs the CutsScan of one (branch, mass) job in a worker process.
+    :param job: tuple (teststat, branch, mass, numdiv, use_prefix_sums)
+    :return: tuple (branch, mass, wall time in seconds, cpu time in seconds, process id)
+    '''
+    teststat, branch, mc, numdiv, use_prefix_sums = job
+    wall_ini = time.time()
+    cpu_ini = time.clock()
+    # each job writes in its own folder <mc>/<teststat>/<branch>/ so that no two workers share a directory
+    w = CutsScan(teststat, branch, numdiv=numdiv, use_prefix_sums=use_prefix_sums, masses=(mc,), output_subdir=branch)
+    del w
+    return branch, mc, time.time() - wall_ini, time.clock() - cpu_ini, os.getpid()
+
+
+class ParallelCutsScan:
+    def __init__(self, teststat, branches, masses=('85', '90', '95'), workers=-1, numdiv=10, use_prefix_sums=0):
+        '''
+        :param teststat: name of the branch used as test statistics
+        :param branches: list with the branches whose cuts are scanned
+        :param masses: Higgs MC to scan for each branch
+        :param workers: number of worker processes. By default one per core
+        :param numdiv: number of divisions of the grid of each CutsScan
+        :param use_prefix_sums: use the prefix-sum engine of CutsScan (see WindowScan)
+        '''
+        self.teststat = teststat
+        self.jobs = [(teststat, branch, mc, numdiv, use_prefix_sums) for branch in branches for mc in masses]
+        self.workers = workers if workers > 0 else cpu_count()
+        self.timings = []
+
+    def run(self):
+        print_banner('Running {n} jobs on {w} workers'.format(n=len(self.jobs), w=self.workers), '#')
+        wall_ini = time.time()
+        analyze_info = AnalyzeInfo()
+        if analyze_info.use_event_cache:
+            # the samples are converted here once, not by every worker at the same time
+            EventCache(analyze_info).load_trees()
+        pool = Pool(self.workers)
+        try:
+            for branch, mc, wall, cpu, pid in pool.imap_unordered(run_cuts_scan_job, self.jobs):
+                self.timings.append((branch, mc, wall, cpu, pid))
+                print 'finished {bra} for Higgs {mc} in {wall:.1f} s (cpu {cpu:.1f} s, pid {pid}) [{done}/{total}]'.format(
+                    bra=branch, mc=mc, wall=wall, cpu=cpu, pid=pid, done=len(self.timings), total=len(self.jobs))
+        finally:
+            pool.close()
+            pool.join()
+        self.total_time = time.time() - wall_ini
+        print_banner('All jobs finished in {t:.1f} s. Sum of the job times: {s:.1f} s'.format(
+            t=self.total_time, s=sum(timing[2] for timing in self.timings)), '#')
+        return self.timings
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('-t', '--teststat', dest='teststat', default='mvissc', help='branch used as test statistics')
+    parser.add_option('-b', '--branches', dest='branches', default='', help='comma separated branches to scan. By default all')
+    parser.add_option('-m', '--mc', dest='masses', default='85,90,95', help='comma separated HiggsMC to scan. e.g. 85,90')
+    parser.add_option('-j', '--workers', dest='workers', default=-1, type='int', help='Number of worker processes')
+    parser.add_option('-n', '--numdiv', dest='numdiv', default=10, type='int', help='Number of divisions of each grid')
+    parser.add_option('-p', '--prefix-sums', dest='use_prefix_sums', default=0, type='int', help='1 to use the prefix-sum engine')
+    (options, args) = parser.parse_args()
+    ana = AnalyzeInfo()
+    branches = options.branches.split(',') if options.branches else ana.branch_names
+    masses = options.masses.split(',')
+    z = ParallelCutsScan(options.teststat, branches, masses, options.workers, options.numdiv, options.use_prefix_sums)
+    z.run()
@@ -0,0 +1,89 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from Likelihood import *
+from multiprocessing import Pool, cpu_count
+from numpy import asarray, concatenate
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+# templates and toys of the worker processes. They are set once per worker by share_toys and only read afterwards
+shared_toys = {}
+
+
+def share_toys(background, signal, toys_bkg, toys_sgnbkg, mu_excl, min_mu, max_mu):
+    shared_toys['likelihood'] = PoissonLikelihood(background, signal)
+    shared_toys['toys_bkg'] = toys_bkg
+    shared_toys['toys_sgnbkg'] = toys_sgnbkg
+    shared_toys['mu_excl'] = mu_excl
+    shared_toys['min_mu'] = min_mu
+    shared_toys['max_mu'] = max_mu
+
+
+def fit_toys_chunk(chunk):
+    '''
+    Fits the toys first ... last-1 of the shared toys.
+    :param chunk: tuple (first, last)
+    :return: tuple (first, q values of the background toys, q values of the signal+background toys, nll evaluations,
+    Newton iterations). The q values are the tuple (q0, q_mu, mu-hat, converged) of PoissonLikelihood.q_values
+    '''
+    first, last = chunk
+    likelihood = shared_toys['likelihood']
+    fit = (shared_toys['mu_excl'], shared_toys['min_mu'], shared_toys['max_mu'])
+    evaluations, iterations = likelihood.nll_evaluations, likelihood.fit_iterations
+    q_bkg = likelihood.q_values(shared_toys['toys_bkg'][first:last], *fit)
+    q_sgnbkg = likelihood.q_values(shared_toys['toys_sgnbkg'][first:last], *fit)
+    return first, q_bkg, q_sgnbkg, likelihood.nll_evaluations - evaluations, likelihood.fit_iterations - iterations
+
+
+class ParallelToyFit:
+    def __init__(self, background, signal, toys_bkg, toys_sgnbkg, mu_excl=1, min_mu=-1, max_mu=3, workers=-1, chunk_size=1000):
+        '''
+        q0 and q_mu of all the toys, fitted in chunks of toys by a pool of processes. The templates and the toys are
+        handed to each worker once when the pool starts, the jobs are only the (first, last) indices of the chunks.
+        :param background, signal: numpy arrays with the templates of the bins used by ProfileL
+        :param toys_bkg, toys_sgnbkg: numpy arrays (number of toys, number of bins) with the background and
+        signal+background toys
+        :param workers: number of worker processes. By default one per core. With 1 the chunks are fitted here
+        :param chunk_size: number of toys of each job
+        '''
+        self.background = asarray(background, dtype='float64')
+        self.signal = asarray(signal, dtype='float64')
+        self.toys_bkg = asarray(toys_bkg, dtype='float64')
+        self.toys_sgnbkg = asarray(toys_sgnbkg, dtype='float64')
+        self.mu_excl = float(mu_excl)
+        self.min_mu = min_mu
+        self.max_mu = max_mu
+        self.workers = workers if workers > 0 else cpu_count()
+        self.chunk_size = max(int(chunk_size), 1)
+        self.number_toys = len(self.toys_bkg)
+        self.chunks = [(first, min(first + self.chunk_size, self.number_toys)) for first in xrange(0, self.number_toys, self.chunk_size)]
+
+    def run(self):
+        '''
+        :return: dictionary with numpy arrays in the order of the toys: 'q0h0', 'qeh0', 'mu_hat_bkg', 'converged_bkg'
+        for the background toys and 'q0h1', 'qeh1', 'mu_hat_sgnbkg', 'converged_sgnbkg' for the signal+background toys,
+        plus the totals 'nll_evaluations' and 'fit_iterations' of all the chunks
+        '''
+        args = (self.background, self.signal, self.toys_bkg, self.toys_sgnbkg, self.mu_excl, self.min_mu, self.max_mu)
+        if self.workers == 1 or len(self.chunks) == 1:
+            share_toys(*args)
+            results = map(fit_toys_chunk, self.chunks)
+        else:
+            pool = Pool(min(self.workers, len(self.chunks)), share_toys, args)
+            try:
+                results = sorted(pool.imap_unordered(fit_toys_chunk, self.chunks), key=lambda result: result[0])
+            finally:
+                pool.close()
+                pool.join()
+        values = {}
+        for position, names in ((1, ('q0h0', 'qeh0', 'mu_hat_bkg', 'converged_bkg')), (2, ('q0h1', 'qeh1', 'mu_hat_sgnbkg', 'converged_sgnbkg'))):
+            for i, name in enumerate(names):
+                values[name] = concatenate([result[position][i] for result in results])
+        values['nll_evaluations'] = sum(result[3] for result in results)
+        values['fit_iterations'] = sum(result[4] for result in results)
+        return values
@@ -9,18 +9,37 @@ from AnalyzeInfo import *
 from array import array
 # from numpy import *
 from Utils import *
+from Likelihood import *
+from numpy import asarray, ndarray
 __author__ = 'Pin-Jung & Diego Alejandro'
 
 class ProfileL:
-    def __init__(self, analyzeInfo, toy_background, toy_signal, background, signal, exclusion_mu=1, npar=1):
+    def __init__(self, analyzeInfo, toy_background, toy_signal, background, signal, exclusion_mu=1, npar=1, mu_hat_bkg=None, mu_hat_sgnbkg=None):
+        '''
+        :param toy_background, toy_signal: histograms of the toys, or numpy arrays with the contents of their bins 1 ...
+        :param mu_hat_bkg, mu_hat_sgnbkg: fitted mu of the background and signal+background toys, if they were already
+        fitted together with other toys (see PoissonLikelihood.fit_mu). By default they are fitted here.
+        '''
         self.branch_info = analyzeInfo
+        # counters of the work of this ProfileL (see AnalysisReport)
+        # nll values computed (not the ones already kept by the ObservedLikelihood), Newton iterations of mu-hat and
+        # Minuit fits
+        self.nll_evaluations = 0
+        self.fit_iterations = 0
+        self.minuit_calls = 0
         self.num_bins = self.branch_info.branch_numbins[self.branch_info.test_statistics_branch]
         self.toy_bkg = toy_background
         self.toy_sgn = toy_signal
-        self.toy_sgnbkg = deepcopy(self.toy_sgn)
-        self.toy_sgnbkg.Add(self.toy_bkg)
         self.background = background
         self.signal = signal
+        # contents of the bins 1 ... num_bins used by the likelihood
+        self.likelihood = get_likelihood(self.bin_contents(self.background), self.bin_contents(self.signal))
+        self.toy_bkg_counts = self.bin_contents(self.toy_bkg)
+        # the signal+background toy is only needed as counts, no histogram is made for it
+        self.toy_sgnbkg_counts = self.bin_contents(self.toy_sgn) + self.toy_bkg_counts
+        # the values of nll and mu-hat of each toy are kept, also for other ProfileL with the same templates and toys
+        self.toy_bkg_likelihood = get_observed_likelihood(self.likelihood, self.toy_bkg_counts)
+        self.toy_sgnbkg_likelihood = get_observed_likelihood(self.likelihood, self.toy_sgnbkg_counts)
         self.mu_excl = float(exclusion_mu)
         self.mu_values = linspace(-1,3,801)
         # Minuit parameters
@@ -32,55 +51,70 @@ class ProfileL:
         self.tolerance = 0.001
         self.min_mu = -1
         self.max_mu = 3
-        self.working_toy = self.toy_bkg
-        self.mu_toy_bkg = self.fit_mu(self.background, self.signal)  #self.fit_mu2()
-        self.working_toy = self.toy_sgnbkg
-        self.mu_toy_sgnbkg = self.fit_mu(self.background, self.signal)  #self.fit_mu2()
+        if mu_hat_bkg is not None:
+            self.toy_bkg_likelihood.set_mu_hat(mu_hat_bkg, self.min_mu, self.max_mu)
+        if mu_hat_sgnbkg is not None:
+            self.toy_sgnbkg_likelihood.set_mu_hat(mu_hat_sgnbkg, self.min_mu, self.max_mu)
+        self.working_toy = self.toy_bkg_likelihood
+        self.mu_toy_bkg = mu_hat_bkg if mu_hat_bkg is not None else self.fit_mu(self.background, self.signal)  #self.fit_mu2()
+        self.working_toy = self.toy_sgnbkg_likelihood
+        self.mu_toy_sgnbkg = mu_hat_sgnbkg if mu_hat_sgnbkg is not None else self.fit_mu(self.background, self.signal)  #self.fit_mu2()
+        self.calculate_q0()
+        self.calculate_qe(self.mu_excl)
+
+    def calculate_q0(self):
         #
         # For discovery:
         #
-        self.working_toy = self.toy_bkg
+        self.working_toy = self.toy_bkg_likelihood
         self.nll_q0_mu_bkg_num = self.nll_value(self.npar, [0])
-        self.working_toy = self.toy_sgnbkg
+        self.working_toy = self.toy_sgnbkg_likelihood
         self.nll_q0_mu_sgnbkg_num = self.nll_value(self.npar, [0])
         # in discovery, q0 = 0 when mu_toy_* is smaller than 0
         if self.mu_toy_bkg < 0:
             self.nll_q0_mu_bkg_den = self.nll_q0_mu_bkg_num  # in this way q0 will be 0
         else:
-            self.working_toy = self.toy_bkg
+            self.working_toy = self.toy_bkg_likelihood
             self.nll_q0_mu_bkg_den = self.nll_value(self.npar, [self.mu_toy_bkg])
         if self.mu_toy_sgnbkg < 0:
             self.nll_q0_mu_sgnbkg_den = self.nll_q0_mu_sgnbkg_num  # in this way q1 will be 0
         else:
-            self.working_toy = self.toy_sgnbkg
+            self.working_toy = self.toy_sgnbkg_likelihood
             self.nll_q0_mu_sgnbkg_den = self.nll_value(self.npar, [self.mu_toy_sgnbkg])
         self.q0_bkg = self.nll_q0_mu_bkg_num - self.nll_q0_mu_bkg_den
         self.Z0_bkg = TMath.Sqrt(self.q0_bkg)
         self.q0_sgnbkg = self.nll_q0_mu_sgnbkg_num - self.nll_q0_mu_sgnbkg_den
         self.Z0_sgnbkg = TMath.Sqrt(self.q0_sgnbkg)
+
+    def calculate_qe(self, mu_excl):
+        '''
+        Calculates q_mu for mu = mu_excl. It can be called again with another mu_excl: mu-hat and the values of nll
+        already computed are not computed again.
+        '''
+        self.mu_excl = float(mu_excl)
         #
         # For exclusion:
         #
-        self.working_toy = self.toy_bkg
+        self.working_toy = self.toy_bkg_likelihood
         self.nll_qe_mu_bkg_num = self.nll_value(self.npar, [self.mu_excl])
-        self.working_toy = self.toy_sgnbkg
+        self.working_toy = self.toy_sgnbkg_likelihood
         self.nll_qe_mu_sgnbkg_num = self.nll_value(self.npar, [self.mu_excl])
         # if mu_toy_* is smaller than 0 then q0 should be -2*ln(L(mu_excl,the'')/L(0,the'')); if mu_toy_* is larger than mu_excl, q0 should be 0
         if self.mu_toy_bkg < 0:
-            self.working_toy = self.toy_bkg
+            self.working_toy = self.toy_bkg_likelihood
             self.nll_qe_mu_bkg_den = self.nll_value(self.npar, [0])  # for L(0,the'')
         elif self.mu_toy_bkg > self.mu_excl:
             self.nll_qe_mu_bkg_den = self.nll_qe_mu_bkg_num  # in this way q0 will be 0
         else:
-            self.working_toy = self.toy_bkg
+            self.working_toy = self.toy_bkg_likelihood
             self.nll_qe_mu_bkg_den = self.nll_value(self.npar, [self.mu_toy_bkg])
         if self.mu_toy_sgnbkg < 0:
-            self.working_toy = self.toy_sgnbkg
+            self.working_toy = self.toy_sgnbkg_likelihood
             self.nll_qe_mu_sgnbkg_den = self.nll_value(self.npar, [0])  # for L(0,the'')
         elif self.mu_toy_sgnbkg > self.mu_excl:
             self.nll_qe_mu_sgnbkg_den = self.nll_qe_mu_sgnbkg_num  # in this way q0 will be 0
         else:
-            self.working_toy = self.toy_sgnbkg
+            self.working_toy = self.toy_sgnbkg_likelihood
             self.nll_qe_mu_sgnbkg_den = self.nll_value(self.npar, [self.mu_toy_sgnbkg])
         self.qe_bkg = self.nll_qe_mu_bkg_num - self.nll_qe_mu_bkg_den
         self.Ze_bkg = TMath.Sqrt(self.qe_bkg)
@@ -93,22 +127,30 @@ class ProfileL:
         :param par: value of "mu", should be handed as a list of one element. e.g. nll_value(1,[0.5])
         :return: the value of the negative log-likelihood
         '''
-        nll = Double(0)
-        for bin in xrange(1, self.num_bins + 1):
-            b = self.background.GetBinContent(bin)
-            s = self.signal.GetBinContent(bin)
-            t = self.working_toy.GetBinContent(bin)
-            if b + par[0]*s == 0:
-                f = 0
-            else:
-                f = (-2)*TMath.Log(TMath.Poisson(t, b + par[0]*s))
-            nll += f
-        return nll
+        evaluations = self.working_toy.nll_evaluations
+        value = self.working_toy.nll(par[0])
+        self.nll_evaluations += self.working_toy.nll_evaluations - evaluations
+        return value
+
+    def bin_contents(self, histo):
+        # a toy can be given as the numpy array of the contents of its bins 1 ... (a row of a ToyEnsemble)
+        if isinstance(histo, ndarray):
+            return asarray(histo[:self.num_bins], dtype='float64')
+        return asarray([histo.GetBinContent(bin) for bin in xrange(1, self.num_bins + 1)], dtype='float64')
 
     def fcn(self, npar, deriv, f, apar, iflag):
         f[0] = self.nll_value(npar, apar)
 
     def fit_mu(self, background, signal):
+        if self.branch_info.mu_fit_method == 'minuit':
+            return self.fit_mu_minuit(background, signal)
+        iterations = self.working_toy.likelihood.fit_iterations
+        mu_hat = self.working_toy.mu_hat(self.min_mu, self.max_mu, self.start_value_mu)
+        self.fit_iterations += self.working_toy.likelihood.fit_iterations - iterations
+        return mu_hat
+
+    def fit_mu_minuit(self, background, signal):
+        self.minuit_calls += 1
         myMinuit = TMinuit(self.npar)
         myMinuit.SetFCN(self.fcn)
         gMinuit.Command('SET PRINT -1')
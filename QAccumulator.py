@@ -0,0 +1,207 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from numpy import arange, argsort, asarray, atleast_1d, clip, concatenate, cumsum, errstate, full, inf, searchsorted, sort, sqrt, where, zeros
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class QuantileSketch:
+    def __init__(self, capacity=2000):
+        '''
+        Mergeable quantile sketch (a stack of compactors). The values of level k stand for 2**k values each. When a
+        level holds more than capacity values, it is sorted and every other value is promoted to the next level, so the
+        memory grows only as capacity * log2(number of values / capacity).
+        :param capacity: number of values a level holds before it is compacted
+        '''
+        self.capacity = capacity
+        self.levels = [zeros(0)]
+        # alternates the half that is promoted, so the compactions do not bias the quantiles
+        self.offset = 0
+
+    def add(self, values):
+        self.levels[0] = concatenate((self.levels[0], values))
+        self.compact()
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(zeros(0))
+            self.levels[level] = concatenate((self.levels[level], values))
+        self.compact()
+
+    def compact(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.capacity:
+                values = sort(self.levels[level])
+                # an odd value stays in its level, so the total weight is kept exactly
+                kept = values[len(values) - len(values) % 2:]
+                values = values[:len(values) - len(values) % 2]
+                if level + 1 == len(self.levels):
+                    self.levels.append(zeros(0))
+                self.levels[level + 1] = concatenate((self.levels[level + 1], values[self.offset::2]))
+                self.levels[level] = kept
+                self.offset = 1 - self.offset
+            level += 1
+
+    def weighted_values(self):
+        # sorted values and the weight of each of them
+        values = concatenate(self.levels)
+        weights = concatenate([full(len(values_level), 2. ** level) for level, values_level in enumerate(self.levels)])
+        order = argsort(values, kind='mergesort')
+        return values[order], weights[order]
+
+
+class QStream:
+    def __init__(self, max_exact=100000, capacity=2000):
+        '''
+        Values of one q statistic, received in any number of chunks. The minimum, the maximum and the number of values
+        are updated online. Up to max_exact values are kept exactly; beyond that they go to a QuantileSketch.
+        '''
+        self.max_exact = max_exact
+        self.capacity = capacity
+        self.count = 0
+        self.minimum = inf
+        self.maximum = -inf
+        self.chunks = []
+        self.sketch = None
+        self.sorted = None
+
+    def is_exact(self):
+        return self.sketch is None
+
+    def add(self, values):
+        values = atleast_1d(asarray(values, dtype='float64')).ravel()
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+        self.sorted = None
+        if self.sketch is not None:
+            self.sketch.add(values)
+            return
+        self.chunks.append(values)
+        if self.count > self.max_exact:
+            self.sketch = QuantileSketch(self.capacity)
+            self.sketch.add(concatenate(self.chunks))
+            self.chunks = []
+
+    def merge(self, other):
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.sorted = None
+        if self.sketch is None and other.sketch is None and self.count <= self.max_exact:
+            self.chunks += other.chunks
+            return
+        if self.sketch is None:
+            self.sketch = QuantileSketch(self.capacity)
+            self.sketch.add(concatenate(self.chunks) if self.chunks else zeros(0))
+            self.chunks = []
+        if other.sketch is not None:
+            self.sketch.merge(other.sketch)
+        elif other.chunks:
+            self.sketch.add(concatenate(other.chunks))
+
+    def sorted_values(self):
+        '''
+        :return: (sorted values, cumulative weights). The cumulative weights have one more element than the values:
+        cumulative[i] is the number of values (exact, or estimated by the sketch) below values[i]
+        '''
+        if self.sorted is None:
+            if self.sketch is None:
+                values = sort(concatenate(self.chunks)) if self.chunks else zeros(0)
+                # the sorted array replaces the chunks, so sorting again after more adds is cheap
+                self.chunks = [values]
+                self.sorted = values, arange(len(values) + 1, dtype='float64')
+            else:
+                values, weights = self.sketch.weighted_values()
+                self.sorted = values, concatenate(([0.], cumsum(weights)))
+        return self.sorted
+
+    def fraction_above(self, q):
+        '''
+        :param q: value or numpy array of values
+        :return: (fraction of the values >= q, binomial error of the fraction)
+        '''
+        values, cumulative = self.sorted_values()
+        return self.fraction(cumulative[-1] - cumulative[searchsorted(values, q, 'left')])
+
+    def fraction_below(self, q):
+        # (fraction of the values <= q, binomial error of the fraction)
+        values, cumulative = self.sorted_values()
+        return self.fraction(cumulative[searchsorted(values, q, 'right')])
+
+    def fraction(self, number):
+        total = float(self.count) if self.count else 1.
+        fraction = number / total
+        return fraction, sqrt(fraction * (1 - fraction) / total)
+
+    def quantile(self, probability):
+        # smallest value with at least the fraction 'probability' of the values below or at it
+        values, cumulative = self.sorted_values()
+        return values[clip(searchsorted(cumulative[1:], probability * cumulative[-1], 'left'), 0, len(values) - 1)]
+
+    def fill(self, histogram):
+        # fills the histogram with all the values in one pass
+        values, cumulative = self.sorted_values()
+        if len(values):
+            histogram.FillN(len(values), values, cumulative[1:] - cumulative[:-1])
+
+
+class QAccumulator:
+    names = ('q0h0', 'q0h1', 'qeh0', 'qeh1')
+
+    def __init__(self, max_exact=100000, capacity=2000):
+        '''
+        Streaming accumulator of the q statistics of the toys: q0 and q_mu of the background toys ('q0h0', 'qeh0') and
+        of the signal+background toys ('q0h1', 'qeh1'). The toys are added as they are fitted and only their q values
+        are kept (see QStream).
+        :param max_exact: number of values of each q kept exactly
+        :param capacity: capacity of the levels of the QuantileSketch used beyond max_exact
+        '''
+        self.streams = {name: QStream(max_exact, capacity) for name in self.names}
+
+    def __getitem__(self, name):
+        return self.streams[name]
+
+    def __len__(self):
+        return self.streams['q0h0'].count
+
+    def add(self, q0_bkg, q0_sgnbkg, qe_bkg, qe_sgnbkg):
+        # values of one toy, or numpy arrays with the values of many toys
+        for name, values in zip(self.names, (q0_bkg, q0_sgnbkg, qe_bkg, qe_sgnbkg)):
+            self.streams[name].add(values)
+
+    def merge(self, other):
+        for name in self.names:
+            self.streams[name].merge(other.streams[name])
+
+    def minimum(self, names):
+        return min(self.streams[name].minimum for name in names)
+
+    def maximum(self, names):
+        return max(self.streams[name].maximum for name in names)
+
+    def cls(self, q_obs):
+        '''
+        CLs of the observed q_mu from the q_mu of the toys:
+         - p_sb: fraction of the signal+background toys with q_mu >= q_obs
+         - p_b: fraction of the background toys with q_mu <= q_obs
+         - CLs = p_sb / (1 - p_b), 0 if p_b = 1
+        The errors are binomial and propagated to CLs (the two sets of toys are independent).
+        :param q_obs: value or numpy array of values of the observed q_mu
+        :return: dictionary with 'p_sb', 'p_sb_error', 'p_b', 'p_b_error', 'cls' and 'cls_error'
+        '''
+        p_sb, p_sb_error = self.streams['qeh1'].fraction_above(q_obs)
+        p_b, p_b_error = self.streams['qeh0'].fraction_below(q_obs)
+        with errstate(divide='ignore', invalid='ignore'):
+            cls = where(p_b == 1, 0., p_sb / (1 - p_b))
+            cls_error = where(p_b == 1, 0., sqrt(p_sb_error ** 2 + (cls * p_b_error) ** 2) / (1 - p_b))
+        return {'p_sb': p_sb, 'p_sb_error': p_sb_error, 'p_b': p_b, 'p_b_error': p_b_error, 'cls': cls, 'cls_error': cls_error}
@@ -0,0 +1,67 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from numpy import arange, asarray, atleast_1d, concatenate, cumsum, empty, exp, log, searchsorted, sqrt, uint64, zeros
+import hashlib
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+# constants of the SplitMix64 generator
+golden_gamma = uint64(0x9E3779B97F4A7C15)
+mix_1 = uint64(0xBF58476D1CE4E5B9)
+mix_2 = uint64(0x94D049BB133111EB)
+
+
+class RandomStreams:
+    def __init__(self, seed=123654):
+        '''
+        Counter-based random numbers. The n-th number of a stream is a hash of (stream key, n), so any toy can be
+        generated on its own, in any order or in another process, and it is always the same.
+        :param seed: global seed. Each stream is addressed by (seed, sample, mass)
+        '''
+        self.seed = seed
+
+    def stream_key(self, sample, mass):
+        digest = hashlib.sha1('{seed}/{sample}/{mass}'.format(seed=self.seed, sample=sample, mass=mass)).hexdigest()
+        return uint64(int(digest[:16], 16))
+
+    def mix(self, z):
+        z = (z ^ (z >> uint64(30))) * mix_1
+        z = (z ^ (z >> uint64(27))) * mix_2
+        return z ^ (z >> uint64(31))
+
+    def uniform(self, sample, mass, counters):
+        '''
+        :param counters: numpy array of non negative integers, the positions in the stream
+        :return: numpy array with uniform numbers in (0, 1), one for each counter
+        '''
+        state = self.stream_key(sample, mass) + (asarray(counters).astype(uint64) + uint64(1)) * golden_gamma
+        return ((self.mix(state) >> uint64(11)).astype('float64') + 0.5) / 9007199254740992.
+
+    def poisson_cdf(self, mean):
+        # cumulative Poisson distribution up to mean + 12 sigma, computed in log space so large means do not underflow
+        kmax = int(mean + 12 * sqrt(mean) + 20)
+        ks = arange(kmax + 1)
+        log_factorial = concatenate(([0.], cumsum(log(arange(1, kmax + 1)))))
+        return cumsum(exp(ks * log(mean) - mean - log_factorial))
+
+    def poisson(self, means, sample, mass, toys):
+        '''
+        :param means: numpy array with the mean of each bin
+        :param toys: numpy array with the indices of the toys to generate
+        :return: numpy array (len(toys), len(means)) of Poisson counts. The toy i always uses the counters
+        i*len(means) ... (i+1)*len(means)-1 of the stream (sample, mass)
+        '''
+        means = atleast_1d(asarray(means, dtype='float64'))
+        toys = atleast_1d(asarray(toys, dtype='int64'))
+        nbins = len(means)
+        counters = toys[:, None] * nbins + arange(nbins)[None, :]
+        uniforms = self.uniform(sample, mass, counters)
+        counts = zeros((len(toys), nbins), dtype='int64')
+        for bin_i in xrange(nbins):
+            if means[bin_i] > 0:
+                cdf = self.poisson_cdf(means[bin_i])
+                counts[:, bin_i] = searchsorted(cdf, uniforms[:, bin_i], 'right').clip(0, len(cdf) - 1)
+        return counts
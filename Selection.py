@@ -0,0 +1,56 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from collections import OrderedDict
+from numpy import ones, asarray
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class Selection:
+    def __init__(self, columns, entries, masks_per_branch=3):
+        '''
+        Boolean masks of the cuts over the columns of one sample. Each cut (branch, low, high) is evaluated once and
+        kept, so changing the value of one cut only evaluates that cut again.
+        :param columns: dictionary with the branch name and a numpy array with its values for each event
+        :param entries: number of events in the columns
+        :param masks_per_branch: number of different cuts that are kept for each branch (e.g. one per MC)
+        '''
+        self.columns = columns
+        self.entries = entries
+        self.masks_per_branch = masks_per_branch
+        self.sub_masks = {}
+        self.last_bounds = None
+        self.last_mask = None
+
+    def sub_mask(self, branch, low, high):
+        masks = self.sub_masks.setdefault(branch, OrderedDict())
+        key = (float(low), float(high))
+        if key in masks:
+            masks[key] = masks.pop(key)
+        else:
+            values = asarray(self.columns[branch], dtype='float64')
+            masks[key] = (values >= key[0]) & (values <= key[1])
+            if len(masks) > self.masks_per_branch:
+                masks.popitem(last=False)
+        return masks[key]
+
+    def mask(self, bounds):
+        '''
+        :param bounds: dictionary with the branch name and the (low, high) values of its cut. See Cuts.getCutBounds
+        :return: boolean numpy array which is True for the events that pass all the cuts. It must not be modified.
+        '''
+        key = sorted((branch, float(low), float(high)) for branch, (low, high) in bounds.iteritems())
+        if key == self.last_bounds:
+            return self.last_mask
+        mask = ones(self.entries, dtype=bool)
+        for branch, low, high in key:
+            mask &= self.sub_mask(branch, low, high)
+        mask.flags.writeable = False
+        self.last_bounds = key
+        self.last_mask = mask
+        return mask
@@ -0,0 +1,115 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from ROOT import TFile
+from glob import glob
+from DataTree import *
+from EventCache import *
+from HistogramFiller import *
+from TemplateCache import *
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class SharedSamples:
+    def __init__(self, analyzeInfo, data_folder='l3higgs189/', cache_folder='l3higgs189_cache/', template_folder='l3higgs189_templates/'):
+        '''
+        Samples loaded once and shared by several Analysis objects, e.g. one for each Higgs mass. The histograms of a
+        sample are filled once for each different selection and are reused by every Analysis with the same selection.
+        The toys come from the stream (sample, mass), so the DataTree of a sample with toys is only reused by the same
+        mass, the other masses get a DataTree with the same histograms and their own toys.
+        :param analyzeInfo: AnalyzeInfo object. It decides if the trees are read from the EventCache
+        '''
+        self.analyze_info = analyzeInfo
+        self.data_folder = data_folder
+        self.names = [i.split('/')[-1].strip('.root').split('higgs_')[-1] for i in glob('{dir}*.root'.format(dir=self.data_folder))]
+        if self.analyze_info.use_event_cache:
+            self.trees = EventCache(self.analyze_info, data_folder, cache_folder).load_trees()
+        else:
+            # the files are kept open while the trees are used
+            self.files = [TFile(f) for f in glob('{dir}*.root'.format(dir=self.data_folder))]
+            self.trees = {f.GetName().split('/')[-1].strip('.root').split('higgs_')[-1]: f.Get('h20') for f in self.files}
+        # dictionary with (sample, selection) and its DataTree, plus the mass if the DataTree has toys
+        self.data_trees = {}
+        # dictionary with (sample, selection) and the last DataTree built for it, whose counts are reused
+        self.selections = {}
+        # dictionary with (sample, selection) and the (counts, selected events) filled by prefill
+        self.filled = {}
+        self.built = 0
+        self.reused = 0
+        # DataTree built with the counts of another DataTree with the same selection
+        self.counts_reused = 0
+        self.template_cache = TemplateCache(analyzeInfo, data_folder, template_folder) if analyzeInfo.use_template_cache else None
+
+    def selection_key(self, analyzeInfo, name):
+        # everything a DataTree depends on: the cuts of the MC analysed, the binning, the toys and the sample
+        binning = tuple((branch, analyzeInfo.branch_numbins[branch], analyzeInfo.branch_min[branch], analyzeInfo.branch_max[branch]) for branch in analyzeInfo.branch_names)
+        # the cut values with repr, as in TemplateCache.key: the cut word keeps only 12 significant digits
+        bounds = Cuts(analyzeInfo).getCutBounds(analyzeInfo.monte_carlo_to_analyse)
+        selection = tuple(sorted((branch, repr(float(low)), repr(float(high))) for branch, (low, high) in bounds.iteritems()))
+        return (name, selection, binning,
+                analyzeInfo.test_statistics_branch, analyzeInfo.number_toys, analyzeInfo.toy_seed)
+
+    def prefill(self, analyze_infos):
+        '''
+        Fills in one scan of each cached sample the histograms of all the different selections of analyze_infos, for
+        the branches of AnalyzeInfo.histogram_branches.
+        :param analyze_infos: list of AnalyzeInfo objects, e.g. one for each Higgs mass
+        '''
+        for name in self.names:
+            tree = self.trees[name]
+            if not isinstance(tree, CachedTree):
+                continue
+            keys = []
+            masks = []
+            for info in analyze_infos:
+                key = self.selection_key(info, name)
+                if key not in keys and key not in self.selections and key not in self.filled and not self.is_cached(info, name):
+                    keys.append(key)
+                    masks.append(tree.selection.mask(Cuts(info).getCutBounds(info.monte_carlo_to_analyse)))
+            if keys:
+                # only the branches filled in bulk by DataTree, the other branches are filled when they are used
+                filler = HistogramFiller(analyze_infos[0], analyze_infos[0].histogram_branches())
+                for key, filled in zip(keys, filler.fill_masks(tree.columns, tree.GetEntries(), masks)):
+                    self.filled[key] = filled
+
+    def is_cached(self, analyzeInfo, name):
+        # the histogram_branches of this selection are already in the TemplateCache
+        if self.template_cache is None:
+            return False
+        cached = self.template_cache.load(self.template_cache.key(analyzeInfo, name))
+        return cached is not None and all(branch in cached[0] for branch in analyzeInfo.histogram_branches())
+
+    def data_tree(self, analyzeInfo, name, cross_section, num_events, random):
+        '''
+        :return: the DataTree of the sample 'name' with the selection of analyzeInfo. If it was already built for
+        another AnalyzeInfo with the same selection (and the same mass, if it has toys), that DataTree is returned
+        '''
+        key = self.selection_key(analyzeInfo, name)
+        # the toys of the Analysis of a mass come from its own stream, as in an Analysis built alone
+        tree_key = key + (analyzeInfo.monte_carlo_to_analyse,) if name != 'data' and analyzeInfo.number_toys else key
+        if tree_key in self.data_trees:
+            self.reused += 1
+            return self.data_trees[tree_key]
+        if key in self.selections:
+            # the histograms are not filled again, only the toys of this mass are generated
+            source = self.selections[key]
+            filled = (dict(source.branches_counts), source.selected_entries)
+            self.counts_reused += 1
+        else:
+            filled = self.filled.pop(key, None)
+        self.built += 1
+        self.data_trees[tree_key] = DataTree(analyzeInfo, self.trees[name], name, cross_section, num_events, random, filled, self.template_cache)
+        self.selections[key] = self.data_trees[tree_key]
+        return self.data_trees[tree_key]
+
+    def release(self):
+        # forgets the DataTree objects (their histograms and toys) and the counts not used yet, e.g. after each point
+        # of a CutsScan. The trees are kept
+        self.data_trees.clear()
+        self.selections.clear()
+        self.filled.clear()
@@ -0,0 +1,156 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from Cuts import *
+from glob import glob
+import hashlib
+import numpy
+import json
+import os
+import errno
+import tempfile
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class TemplateCache:
+    def __init__(self, analyzeInfo, data_folder='l3higgs189/', cache_folder='l3higgs189_templates/', max_bytes=-1):
+        '''
+        Filled histograms (the unscaled counts of each bin) of each sample, stored on disk under a hash of everything
+        they depend on, so a new session with the same configuration does not fill them again. Each entry is
+        <cache_folder>/<hash>.npz with the counts of the branches filled so far.
+        :param analyzeInfo: AnalyzeInfo object
+        :param data_folder: folder with the higgs_*.root files, whose fingerprints are part of the key
+        :param cache_folder: folder of the entries
+        :param max_bytes: size of the folder above which the least recently used entries are removed. By default
+        analyzeInfo.template_cache_size
+        '''
+        self.analyze_info = analyzeInfo
+        self.data_folder = data_folder
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes if max_bytes != -1 else self.analyze_info.template_cache_size
+        self.files = {f.split('/')[-1].strip('.root').split('higgs_')[-1]: f for f in glob('{dir}*.root'.format(dir=self.data_folder))}
+        self.hits = 0
+        self.misses = 0
+        # size of the folder, counted when it is first needed and kept up to date by store, so the folder is only
+        # scanned again when it goes over max_bytes
+        self.folder_bytes = None
+
+    def fingerprint(self, name):
+        # same fingerprint as EventCache: a source file that changed makes a new key
+        if name not in self.files:
+            return None
+        stat = os.stat(self.files[name])
+        return [stat.st_size, stat.st_mtime]
+
+    def key(self, analyzeInfo, name):
+        '''
+        :return: hash of the selection (toggled cuts and their values for the MC analysed), the binning of all the
+        branches, the scaling inputs and the fingerprint of the source file of the sample 'name'
+        '''
+        mc = analyzeInfo.monte_carlo_to_analyse
+        bounds = Cuts(analyzeInfo).getCutBounds(mc)
+        content = {'sample': name,
+                   'selection': sorted([branch, repr(float(low)), repr(float(high))] for branch, (low, high) in bounds.iteritems()),
+                   'binning': [[branch, analyzeInfo.branch_numbins[branch], repr(float(analyzeInfo.branch_min[branch])),
+                                repr(float(analyzeInfo.branch_max[branch]))] for branch in analyzeInfo.branch_names],
+                   'scaling': [repr(float(analyzeInfo.cross_sections.get(name, -1))), analyzeInfo.num_events.get(name, -1),
+                               repr(float(analyzeInfo.data_luminosity))],
+                   'source': self.fingerprint(name)}
+        return hashlib.sha1(json.dumps(content, sort_keys=True)).hexdigest()
+
+    def entry_name(self, key):
+        return os.path.join(self.cache_folder, key + '.npz')
+
+    def load(self, key):
+        '''
+        :return: (dictionary with the branch name and its counts, number of selected events), or None if the entry
+        does not exist
+        '''
+        entry_name = self.entry_name(key)
+        if not os.path.isfile(entry_name):
+            self.misses += 1
+            return None
+        try:
+            with numpy.load(entry_name) as entry:
+                counts = {branch: entry[branch] for branch in entry.files if branch != '__selected__'}
+                selected = int(entry['__selected__'])
+        except (IOError, ValueError, KeyError):
+            # a broken entry (e.g. an interrupted write) is filled again
+            self.misses += 1
+            return None
+        # the modification time is the last use, for the eviction
+        try:
+            os.utime(entry_name, None)
+        except OSError:
+            # removed by another process after it was read
+            pass
+        self.hits += 1
+        return counts, selected
+
+    def store(self, key, counts, selected):
+        # adds the counts of the branches to the entry, keeping the branches already stored
+        try:
+            os.makedirs(self.cache_folder)
+        except OSError:
+            if not os.path.isdir(self.cache_folder):
+                raise
+        entry_name = self.entry_name(key)
+        stored = {}
+        old_bytes = 0
+        if os.path.isfile(entry_name):
+            try:
+                old_bytes = os.path.getsize(entry_name)
+                with numpy.load(entry_name) as entry:
+                    stored = {branch: entry[branch] for branch in entry.files}
+            except (IOError, OSError, ValueError):
+                stored = {}
+        stored.update(counts)
+        stored['__selected__'] = numpy.array(selected)
+        # a temporary file of its own, so several processes can write the same entry. It does not end in .npz, so it
+        # is never taken as an entry
+        handle, temp_name = tempfile.mkstemp(dir=self.cache_folder, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            numpy.savez(f, **stored)
+        new_bytes = os.path.getsize(temp_name)
+        os.rename(temp_name, entry_name)
+        if self.max_bytes < 0:
+            return
+        if self.folder_bytes is None:
+            self.evict(entry_name)
+        else:
+            self.folder_bytes += new_bytes - old_bytes
+            if self.folder_bytes > self.max_bytes:
+                self.evict(entry_name)
+
+    def evict(self, keep=None):
+        # removes the least recently used entries until the folder is not larger than max_bytes. Other processes may
+        # remove or replace entries at the same time, an entry that is already gone is skipped
+        if self.max_bytes < 0:
+            return
+        entries = []
+        for entry_name in glob(os.path.join(self.cache_folder, '*.npz')):
+            try:
+                stat = os.stat(entry_name)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_name))
+        total = sum(size for mtime, size, entry_name in entries)
+        for mtime, size, entry_name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry_name == keep:
+                continue
+            try:
+                os.remove(entry_name)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+            total -= size
+        self.folder_bytes = total
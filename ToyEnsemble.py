@@ -0,0 +1,91 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from numpy import asarray, zeros
+from copy import copy
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+def compact_counts(counts):
+    # stores the counts with the smallest unsigned integer type that holds them
+    counts = asarray(counts)
+    maximum = counts.max() if counts.size else 0
+    for dtype, limit in (('uint8', 255), ('uint16', 65535), ('uint32', 4294967295)):
+        if maximum <= limit:
+            return counts.astype(dtype)
+    return counts.astype('uint64')
+
+
+class ToyEnsemble:
+    def __init__(self, counts, nbins, xmin, xmax, name='toys', scale=1.):
+        '''
+        All the toys of a sample in one 2-D array. The contents of the toys are scale * counts, where the counts are
+        the integer Poisson counts of the toy generation.
+        :param counts: numpy array (number of toys, nbins). counts[i, j] is the content of the bin j+1 of the toy i
+        :param nbins, xmin, xmax: binning shared by all the toys
+        :param name: stem of the names of the TH1F made by histogram()
+        :param scale: factor applied to the counts, e.g. the scaling factor of the sample
+        '''
+        self.nbins = nbins
+        self.xmin = xmin
+        self.xmax = xmax
+        self.name = name
+        # list of (counts, scale). A sum of ensembles keeps the counts of each sample and adds them when needed
+        self.components = [(compact_counts(counts), float(scale))]
+        self.number_toys = len(self.components[0][0])
+
+    def __len__(self):
+        return self.number_toys
+
+    def __getitem__(self, num):
+        return self.histogram(num)
+
+    def scaled(self, factor, name=None):
+        # shallow copy: the counts are shared, only the scales change
+        ensemble = copy(self)
+        ensemble.name = name if name is not None else self.name
+        ensemble.components = [(counts, scale * factor) for counts, scale in self.components]
+        return ensemble
+
+    @staticmethod
+    def sum(ensembles, name='toys'):
+        '''
+        :param ensembles: list of ToyEnsemble with the same binning and number of toys
+        :return: ToyEnsemble whose toy i is the sum of the toys i of all the ensembles
+        '''
+        total = ensembles[0].scaled(1., name)
+        for ensemble in ensembles[1:]:
+            total.components = total.components + ensemble.components
+        return total
+
+    def contents(self, num=None):
+        '''
+        :param num: index of a toy. By default all the toys
+        :return: numpy array (nbins) with the contents of the toy num, or (number of toys, nbins) with all of them
+        '''
+        rows = slice(None) if num is None else num
+        total = zeros((self.number_toys, self.nbins) if num is None else self.nbins, dtype='float64')
+        for counts, scale in self.components:
+            total += scale * counts[rows]
+        return total
+
+    def histogram(self, num, name=None):
+        # TH1F copy of one toy, e.g. to draw it or to write it in a root file. ROOT is only imported here, the toys
+        # themselves are numpy arrays
+        from ROOT import TH1F
+        histo_name = name if name is not None else self.name + '_' + str(num)
+        histogram = TH1F(histo_name, histo_name, self.nbins, self.xmin, self.xmax)
+        histogram.SetDirectory(0)
+        histogram.SetBinErrorOption(TH1F.kPoisson)
+        contents = self.contents(num)
+        for bin_i in xrange(1, self.nbins + 1):
+            histogram.SetBinContent(bin_i, float(contents[bin_i - 1]))
+        return histogram
+
+    def nbytes(self):
+        return sum(counts.nbytes for counts, scale in self.components)
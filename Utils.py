@@ -1,4 +1,100 @@
 # utility functions
+from collections import OrderedDict
 
 def print_banner(msg, symbol='='):
-    print '\n{delim}\n{msg}\n{delim}\n'.format(delim=len(str(msg)) * symbol, msg=msg)
\ No newline at end of file
+    print '\n{delim}\n{msg}\n{delim}\n'.format(delim=len(str(msg)) * symbol, msg=msg)
+
+
+class LRUCache:
+    # dictionary that keeps at most max_size items, dropping the least recently used one first
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        if key not in self.items:
+            return default
+        value = self.items.pop(key)
+        self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.items.clear()
+
+
+class LazyHistograms:
+    # dictionary of branch name and histogram whose histograms are made by 'make' the first time they are asked for
+    def __init__(self, keys, make, make_many=None):
+        '''
+        :param keys: branch names of the dictionary
+        :param make: function of a branch name that returns its histogram
+        :param make_many: function of a list of branch names that returns a dictionary with their histograms, used by
+        fill to make several branches at once (e.g. in one scan of the events). By default make is called for each
+        '''
+        self.keys_list = list(keys)
+        self.make = make
+        self.make_many = make_many
+        self.made = {}
+
+    def __getitem__(self, key):
+        if key not in self.made:
+            if key not in self.keys_list:
+                raise KeyError(key)
+            self.made[key] = self.make(key)
+        return self.made[key]
+
+    def __setitem__(self, key, value):
+        if key not in self.keys_list:
+            self.keys_list.append(key)
+        self.made[key] = value
+
+    def __contains__(self, key):
+        return key in self.keys_list
+
+    def __iter__(self):
+        return iter(self.keys_list)
+
+    def __len__(self):
+        return len(self.keys_list)
+
+    def fill(self, keys):
+        # makes at once the histograms of keys that were not made yet
+        missing = [key for key in keys if key in self.keys_list and key not in self.made]
+        if missing and self.make_many is not None:
+            self.made.update(self.make_many(missing))
+        for key in missing:
+            self[key]
+        return self
+
+    def is_made(self, key):
+        return key in self.made
+
+    def keys(self):
+        return list(self.keys_list)
+
+    def values(self):
+        # makes all the histograms
+        return [self[key] for key in self.keys_list]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys_list]
+
+    def iteritems(self):
+        for key in self.keys_list:
+            yield key, self[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
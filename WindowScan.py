@@ -0,0 +1,85 @@
+# ---------------------------------------------------
+#           HIGGS PROJECT for SMATEP
+#   author: Pin-Jung Diego Alejandro
+# ---------------------------------------------------
+
+from Cuts import *
+from HistogramFiller import *
+from EventCache import *
+from numpy import asarray, argsort, concatenate, cumsum, full, searchsorted, sqrt, where, zeros, errstate
+
+__author__ = 'Pin-Jung & Diego Alejandro'
+
+from Utils import *
+
+
+class WindowScan:
+    def __init__(self, analyzeInfo, teststat, branch, mc='85', trees=None):
+        '''
+        Efficiency, purity and significance of every cut window low <= branch <= high, computed from the sorted values
+        of the branch and the cumulative sums of the weights of the events. The other toggled cuts of 'mc' are applied.
+        :param analyzeInfo: AnalyzeInfo object
+        :param teststat: branch of the test statistics. Only the events inside its histogram range are counted, as in
+        Analysis.purity and Analysis.significance
+        :param branch: branch whose cut is scanned
+        :param mc: Higgs MC used as signal. e.g. '85'
+        :param trees: dictionary with the sample name and its CachedTree. By default they are loaded with EventCache
+        '''
+        self.analyze_info = analyzeInfo
+        self.teststat = teststat
+        self.branch = branch
+        self.mc = mc
+        self.trees = trees if trees is not None else EventCache(self.analyze_info).load_trees()
+        self.cuts = Cuts(self.analyze_info)
+        self.filler = HistogramFiller(self.analyze_info, [self.teststat])
+        self.background_names = [name for name in self.trees.keys() if name != 'data' and not name.isdigit()]
+        self.signal_values, self.signal_sums = self.prefix_sums([self.mc])
+        self.background_values, self.background_sums = self.prefix_sums(self.background_names)
+        self.signal_total = self.signal_sums[-1]
+
+    def scaling_factor(self, name):
+        # same normalization as DataTree
+        luminosity = float(self.analyze_info.num_events[name]) / self.analyze_info.cross_sections[name]
+        return self.analyze_info.data_luminosity / luminosity
+
+    def base_mask(self, tree):
+        bounds = self.cuts.getCutBounds(self.mc)
+        bounds.pop(self.branch, None)
+        nbins, hmin, hmax = self.filler.binning[self.teststat]
+        bins = self.filler.bin_indices(asarray(tree.columns[self.teststat]), nbins, hmin, hmax)
+        return tree.selection.mask(bounds) & (bins >= 1) & (bins <= nbins)
+
+    def prefix_sums(self, names):
+        values = []
+        weights = []
+        for name in names:
+            tree = self.trees[name]
+            selected = asarray(tree.columns[self.branch], dtype='float64')[self.base_mask(tree)]
+            values.append(selected)
+            weights.append(full(len(selected), self.scaling_factor(name)))
+        values = concatenate(values) if values else zeros(0)
+        weights = concatenate(weights) if weights else zeros(0)
+        order = argsort(values, kind='mergesort')
+        return values[order], concatenate(([0.], cumsum(weights[order])))
+
+    def window(self, values, sums, lows, highs):
+        # number of events and sum of weights with low <= value <= high
+        first = searchsorted(values, lows, 'left')
+        last = searchsorted(values, highs, 'right')
+        return last - first, sums[last] - sums[first]
+
+    def scan(self, lows, highs):
+        '''
+        :param lows: numpy array with the low cuts
+        :param highs: numpy array with the high cuts, same shape as lows
+        :return: efficiency, purity and significance for each (low, high), as numpy arrays with the shape of lows
+        '''
+        lows = asarray(lows, dtype='float64')
+        highs = asarray(highs, dtype='float64')
+        ns, s = self.window(self.signal_values, self.signal_sums, lows, highs)
+        nb, b = self.window(self.background_values, self.background_sums, lows, highs)
+        with errstate(divide='ignore', invalid='ignore'):
+            efficiency = s / self.signal_total if self.signal_total != 0 else zeros(lows.shape)
+            purity = where(ns + nb == 0, 0., s / (s + b + 0.00000000001))
+            significance = where(nb == 0, 0., s / sqrt(b))
+        return efficiency, purity, significance